@@ -0,0 +1,145 @@
+import numpy as np
+
+
+def cos_products(angles):
+    """
+    Computes prod_w cos(angles[..., w]) and the derivative of every factor's removal.
+
+    Args:
+        angles (np.ndarray): Angles of shape (..., n), multiplied along the last axis.
+
+    Returns:
+        tuple:
+            - np.ndarray: The products, shape (...).
+            - np.ndarray: prod_{w' != w} cos(angles[..., w']) for every w, shape (..., n),
+              from exclusive prefix and suffix products (no division by a vanishing cosine).
+    """
+    factors = np.cos(angles)
+    ones = np.ones(factors.shape[:-1] + (1,))
+    prefix = np.cumprod(np.concatenate((ones, factors[..., :-1]), axis=-1), axis=-1)
+    suffix = np.cumprod(np.concatenate((ones, factors[..., :0:-1]), axis=-1), axis=-1)[..., ::-1]
+    return prefix[..., -1] * factors[..., -1], prefix * suffix
+
+
+class AnalyticQAOA:
+    """
+    Closed-form depth-1 QAOA correlations, a drop-in replacement of `StatevectorQAOA` for p = 1.
+
+    For the cost C = sum_i h_i Z_i + sum_{i<j} J_ij Z_i Z_j, the state
+    RX(2 beta)^n exp(-i gamma C) |+>^n gives (Ozaeta, van Dam and McMahon, 2022)
+
+        <Z_u Z_v> = sin(4 beta) / 2 * sin(2 gamma J_uv)
+                        * [cos(2 gamma h_u) prod_w cos(2 gamma J_uw) + (u <-> v)]
+                    - sin(2 beta)^2 / 2
+                        * [cos(2 gamma (h_u + h_v)) prod_w cos(2 gamma (J_uw + J_vw))
+                           - cos(2 gamma (h_u - h_v)) prod_w cos(2 gamma (J_uw - J_vw))],
+
+    with the products over w != u, v. Every correlation and its two parameter derivatives
+    cost O(n), so problems far beyond statevector sizes can be evaluated.
+
+    Parameters
+    ----------
+    depth : int
+        The number of QAOA layers; must be 1.
+
+    Q : np.ndarray
+        The Ising matrix of the problem (same convention as `QAOA_layer`).
+
+    edges : tuple, optional
+        Precomputed (rows, cols) arrays of the edges, in row-major order. By default they
+        are the nonzero off-diagonal entries of Q.
+    """
+
+    def __init__(self, depth, Q, edges=None):
+        if depth != 1:
+            raise ValueError("The closed-form correlations only exist for QAOA_depth == 1.")
+        self.Q = np.asarray(Q, dtype=float)
+        self.p = depth
+        self.n = self.Q.shape[0]
+        self.fields = np.diag(self.Q)
+        self.J = self.Q + self.Q.T
+        np.fill_diagonal(self.J, 0)
+        if edges is None:
+            edges = np.nonzero(self.Q - np.diag(self.fields))
+        self.rows, self.cols = edges
+
+    def _terms(self, rows, cols, gamma):
+        """
+        Evaluates the two bracketed sums of the closed form for the pairs (rows, cols).
+
+        Returns
+        -------
+        tuple
+            The terms weighted by sin(4 beta) / 2 and by -sin(2 beta)^2 / 2 in the closed
+            form, followed by their derivatives with respect to gamma.
+        """
+        rows, cols = np.asarray(rows), np.asarray(cols)
+        pairs = np.arange(len(rows))
+        A, B = self.J[rows], self.J[cols]
+        # Exclude w = u, v from the products: a zero angle contributes a factor of 1
+        for X in (A, B):
+            X[pairs, rows] = 0
+            X[pairs, cols] = 0
+        h_u, h_v, J_uv = self.fields[rows], self.fields[cols], self.J[rows, cols]
+
+        # T_k = cos(2 gamma h_k) prod_w cos(2 gamma X_kw) and its derivative
+        terms, d_terms = [], []
+        for h, X in ((h_u, A), (h_v, B), (h_u + h_v, A + B), (h_u - h_v, A - B)):
+            product, rest = cos_products(2 * gamma * X)
+            d_product = np.sum(-2 * X * np.sin(2 * gamma * X) * rest, axis=-1)
+            terms.append(np.cos(2 * gamma * h) * product)
+            d_terms.append(-2 * h * np.sin(2 * gamma * h) * product + np.cos(2 * gamma * h) * d_product)
+
+        first = np.sin(2 * gamma * J_uv) * (terms[0] + terms[1])
+        d_first = (2 * J_uv * np.cos(2 * gamma * J_uv) * (terms[0] + terms[1])
+                   + np.sin(2 * gamma * J_uv) * (d_terms[0] + d_terms[1]))
+        return first, terms[2] - terms[3], d_first, d_terms[2] - d_terms[3]
+
+    def _pair_expectations(self, rows, cols, params):
+        """
+        Returns <Z_u Z_v> for the pairs (rows, cols).
+        """
+        gamma, beta = np.asarray(params, dtype=float)
+        first, second, _, _ = self._terms(rows, cols, gamma)
+        return np.sin(4 * beta) / 2 * first - np.sin(2 * beta) ** 2 / 2 * second
+
+    def correlations(self, params):
+        """
+        Returns the (n, n) matrix of <Z_i Z_j> of the final QAOA state.
+
+        Parameters
+        ----------
+        params : array_like
+            Gamma followed by beta.
+        """
+        rows, cols = np.triu_indices(self.n, 1)
+        matrix = np.eye(self.n)
+        matrix[rows, cols] = matrix[cols, rows] = self._pair_expectations(rows, cols, params)
+        return matrix
+
+    def edge_expectations(self, params):
+        """
+        Returns <Z_i Z_j> for every edge, in the order of `StatevectorQAOA.edge_expectations`.
+        """
+        return self._pair_expectations(self.rows, self.cols, params)
+
+    def edge_jacobian(self, params):
+        """
+        Computes d<Z_i Z_j>/d(gamma, beta) for every edge by differentiating the closed form.
+
+        Parameters
+        ----------
+        params : array_like
+            Gamma followed by beta.
+
+        Returns
+        -------
+        np.ndarray
+            Dense (edges, 2) Jacobian; columns follow the order of `params`.
+        """
+        gamma, beta = np.asarray(params, dtype=float)
+        first, second, d_first, d_second = self._terms(self.rows, self.cols, gamma)
+        jacobian = np.empty((len(self.rows), 2))
+        jacobian[:, 0] = np.sin(4 * beta) / 2 * d_first - np.sin(2 * beta) ** 2 / 2 * d_second
+        jacobian[:, 1] = 2 * np.cos(4 * beta) * first - np.sin(4 * beta) * second
+        return jacobian
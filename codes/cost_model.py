@@ -0,0 +1,152 @@
+import json
+import os
+import platform
+import tempfile
+import time
+import numpy as np
+
+# Directory of the per-host cost models of `CostModel.for_host`
+DEFAULT_DIRECTORY = os.path.join(os.environ.get('XDG_CACHE_HOME', os.path.join(os.path.expanduser('~'), '.cache')), 'rl_qaoa')
+
+
+class CostModel:
+    """
+    Calibrated wall time of the solvers of a machine as a function of the problem size.
+
+    Every solver label (e.g. 'exact', or the model kind of a quantum simulator) is timed on a
+    few problem sizes by `calibrate`, and log2 of its time is fitted by a line in the size, so
+    the cost of sizes that were not measured is extrapolated. With a `path`, the fits are saved
+    in a JSON file under the host name, so every machine calibrates a solver once;
+    `for_host` opens the default file of the machine.
+
+    Parameters
+    ----------
+    path : str, optional
+        JSON file holding the fits. Fits made on other machines are kept in the file but never
+        used. None keeps the fits in memory only.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.machine = platform.node()
+        self.fits = self._load().get(self.machine, {})
+
+    @classmethod
+    def for_host(cls, directory=DEFAULT_DIRECTORY):
+        """
+        Returns the cost model of this machine, saved as cost_model_<host>.json in `directory`,
+        so the solvers are calibrated once per machine and reused by later runs.
+        """
+        return cls(os.path.join(directory, f'cost_model_{platform.node()}.json'))
+
+    def _load(self):
+        """
+        Returns the fits of all machines stored in the file.
+        """
+        if self.path is None:
+            return {}
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def has(self, name):
+        """
+        Returns whether the solver `name` is calibrated on this machine.
+        Fits saved without their calibration sizes are calibrated again.
+        """
+        return len(self.fits.get(name, ())) == 3
+
+    def max_size(self, name):
+        """
+        Returns the largest problem size the solver `name` was timed on; the fit is
+        extrapolated beyond it.
+        """
+        return self.fits[name][2]
+
+    def predict(self, name, size):
+        """
+        Returns the predicted time in seconds of the solver `name` on a problem of `size` nodes.
+        """
+        intercept, slope = self.fits[name][:2]
+        return 2.0 ** (intercept + slope * size)
+
+    def calibrate(self, name, run, sizes, repeats=3, seed=0):
+        """
+        Times a solver on random Ising problems and saves the fit of its cost.
+
+        Parameters
+        ----------
+        name : str
+            Solver label.
+
+        run : callable
+            Solves an (n, n) upper-triangular Ising matrix.
+
+        sizes : list of int
+            Problem sizes timed; the best of `repeats` runs is kept for each.
+
+        repeats : int, default=3
+            Runs per size.
+
+        seed : int, default=0
+            Seed of the random problems.
+
+        Returns
+        -------
+        tuple
+            Intercept and slope of log2(seconds) against the size, and the largest size timed.
+        """
+        rng = np.random.default_rng(seed)
+        times = []
+        for size in sizes:
+            Q = np.triu(rng.normal(size=(size, size)))
+            best = np.inf
+            for _ in range(repeats):
+                start = time.perf_counter()
+                run(Q)
+                best = min(best, time.perf_counter() - start)
+            times.append(max(best, 1e-9))
+        slope, intercept = np.polyfit(sizes, np.log2(times), 1)
+        self.fits[name] = (float(intercept), float(max(slope, 0.0)), int(max(sizes)))
+        self.save()
+        return self.fits[name]
+
+    def save(self):
+        """
+        Atomically writes the fits of this machine, keeping those of the other machines.
+        Does nothing without a `path`.
+        """
+        if self.path is None:
+            return
+        data = self._load()
+        data[self.machine] = self.fits
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(data, f, indent=1)
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+
+def as_cost_model(cost_model):
+    """
+    Converts the `cost_model` argument of the models into a `CostModel`.
+
+    Args:
+        cost_model (CostModel, str, bool or None): A cost model, the path of its JSON file,
+            True for the default file of the machine (`CostModel.for_host`), or None/False.
+
+    Returns:
+        CostModel or None: The cost model, None when the handoff is disabled.
+    """
+    if cost_model is True:
+        return CostModel.for_host()
+    if isinstance(cost_model, str):
+        return CostModel(cost_model)
+    return cost_model or None
@@ -2,6 +2,11 @@ from pennylane import numpy as np
 import numpy as npo
 import matplotlib.pyplot as plt
 import copy
+import hashlib
+import os
+import sys
+import tempfile
+from collections import OrderedDict
 import numpy as np
 
 def data_to_QUBO(matrix, hamming_weight, lamb, relative_diff=None):
@@ -102,7 +107,23 @@ def zero_lower_triangle(matrix):
 
     return result
 
+EDGE_KEY_BASE = 1 << 16
+
+
+def edge_key(i, j, sign):
+    """
+    Encodes an elimination decision (i, j, sign) as a single integer tree key.
+    :param i: Original index of the first node of the edge.
+    :param j: Original index of the second node of the edge.
+    :param sign: Sign of the edge correlation (positive: same value, negative: different values).
+    :return: int key, unique for node indices below EDGE_KEY_BASE (an array of keys for array arguments).
+    """
+    return (i * EDGE_KEY_BASE + j) * 2 + (sign < 0) * 1
+
+
 class TreeNode:
+    __slots__ = ('key', 'value', 'children', 'last_visit')
+
     def __init__(self, key, value):
         """
         Initializes a tree node.
@@ -111,7 +132,8 @@ class TreeNode:
         """
         self.key = key  # Node's unique key
         self.value = value  # Node's stored value
-        self.children = {}  # Dictionary to store child nodes (key -> TreeNode mapping)
+        self.children = None  # Child nodes (key -> TreeNode mapping), allocated on the first child
+        self.last_visit = 0  # Episode in which the node was last visited
 
     def __repr__(self):
         """
@@ -121,22 +143,38 @@ class TreeNode:
 
 
 class Tree:
-    def __init__(self, root_key, root_value):
+    # Estimated bytes of one node besides its value: the slotted object and its entry in the parent's children dict
+    NODE_BYTES = sys.getsizeof(TreeNode(0, None)) + 32
+    # Eviction frees subtrees until the tree is back under this fraction of the budget
+    LOW_WATER = 0.75
+
+    def __init__(self, root_key, root_value, max_bytes=None):
         """
         Initializes a tree with a root node.
         :param root_key: The unique key for the root node.
         :param root_value: The data associated with the root node.
+        :param max_bytes: Byte budget of the tree (None for unbounded). When exceeded, the
+                          least recently visited subtrees are evicted.
         """
-        self.root = TreeNode(root_key, root_value)  # Create the root node
+        self.root = TreeNode(root_key, None)  # Create the root node
         self.state = self.root  # Set the current state to the root node
-        self.node_num = 0
+        self.node_num = 0  # Number of nodes created so far
+        self.size = 1  # Number of nodes currently held
+        self.nbytes = self.NODE_BYTES
+        self.max_bytes = max_bytes
+        self.clock = 0  # Episode counter used for least-recently-visited eviction
+        self.evicted = 0
+        if root_value is not None:
+            self.set_value(root_value)
+
     def has_child(self, key):
         """
         Checks if the current state (node) has a child with the given key.
         :param key: The key of the child node to check.
         :return: True if the child exists, False otherwise.
         """
-        return key in self.state.children  # Check if the key exists in the children dictionary
+        children = self.state.children
+        return children is not None and key in children  # Check if the key exists in the children dictionary
 
     def move(self, key):
         """
@@ -146,6 +184,7 @@ class Tree:
         """
         if self.has_child(key):  # If the child exists, move to it
             self.state = self.state.children[key]
+            self.state.last_visit = self.clock
 
         else:
             raise ValueError(f"Error: No child with key '{key}' exists.")  # Raise an error if child doesn't exist
@@ -158,18 +197,176 @@ class Tree:
         :raises ValueError: If the key already exists.
         """
         if not self.has_child(key):  # If the child does not exist, create it
-            new_node = TreeNode(key, value)
+            new_node = TreeNode(key, None)
+            new_node.last_visit = self.clock
+            if self.state.children is None:
+                self.state.children = {}
             self.state.children[key] = new_node  # Add the new node to the children dictionary
             self.node_num +=1
+            self.size += 1
+            self.nbytes += self.NODE_BYTES
+            if value is not None:
+                self._store(new_node, value)
+            self._check_budget()
         else:
             raise ValueError(f"Error: Child '{key}' already exists.")  # Raise an error if child already exists
 
+    def set_value(self, value):
+        """
+        Stores value in the current node as a float32 array.
+        :param value: The data to store (array-like).
+        :return: The stored array, so a freshly computed value is used with the same rounding
+                 as a later cache hit.
+        """
+        self._store(self.state, value)
+        self._check_budget()
+        return self.state.value
+
+    def _store(self, node, value):
+        if node.value is not None:
+            self.nbytes -= node.value.nbytes
+        node.value = npo.array(value, dtype=npo.float32)
+        self.nbytes += node.value.nbytes
+
     def reset_state(self):
         """
-        Resets the current state back to the root node.
+        Resets the current state back to the root node and starts a new visit.
         """
         self.state = self.root  # Set state back to the root node
+        self.clock += 1
+        self.root.last_visit = self.clock
+
+    def _check_budget(self):
+        """
+        Evicts the least recently visited subtrees while the tree exceeds its byte budget.
+
+        A node is stamped whenever a walk passes through it, so a node is never older than
+        its descendants and evicting the oldest nodes drops whole stale subtrees. Nodes on
+        the current walk are never evicted.
+        """
+        if self.max_bytes is None or self.nbytes <= self.max_bytes:
+            return
+        candidates = []
+        stack = [(self.root, 0)]
+        while stack:
+            node, depth = stack.pop()
+            if node.children is None:
+                continue
+            for child in node.children.values():
+                if child.last_visit < self.clock:
+                    candidates.append((child.last_visit, depth, node, child))
+                stack.append((child, depth + 1))
+        candidates.sort(key=lambda item: (item[0], item[1]))
+        target = self.max_bytes * self.LOW_WATER
+        for _, _, parent, child in candidates:
+            if self.nbytes <= target:
+                break
+            if child.last_visit < 0:  # already dropped with an evicted ancestor
+                continue
+            del parent.children[child.key]
+            self._drop(child)
+
+    def _drop(self, node):
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            node.last_visit = -1
+            self.size -= 1
+            self.evicted += 1
+            self.nbytes -= self.NODE_BYTES
+            if node.value is not None:
+                self.nbytes -= node.value.nbytes
+            if node.children is not None:
+                stack.extend(node.children.values())
+
+    def nodes(self):
+        """
+        Iterates over all nodes of the tree, depth first.
+        """
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            yield node
+            if node.children is not None:
+                stack.extend(node.children.values())
+
+    def merge(self, other):
+        """
+        Folds the nodes of another tree into this one, e.g. a tree grown in a worker
+        process from a snapshot of this tree.
+        Values already held here are kept; missing values and missing subtrees are taken over.
+        :param other: The tree to merge. Its grafted subtrees become part of this tree.
+        """
+        stack = [(self.root, other.root)]
+        while stack:
+            mine, theirs = stack.pop()
+            mine.last_visit = max(mine.last_visit, theirs.last_visit)
+            if mine.value is None and theirs.value is not None:
+                self._store(mine, theirs.value)
+            if theirs.children is None:
+                continue
+            if mine.children is None:
+                mine.children = {}
+            for key, child in theirs.children.items():
+                if key in mine.children:
+                    stack.append((mine.children[key], child))
+                    continue
+                mine.children[key] = child  # graft the whole subtree
+                grafted = [child]
+                while grafted:
+                    node = grafted.pop()
+                    self.node_num += 1
+                    self.size += 1
+                    self.nbytes += self.NODE_BYTES
+                    if node.value is not None:
+                        self.nbytes += node.value.nbytes
+                    if node.children is not None:
+                        grafted.extend(node.children.values())
+        self.clock = max(self.clock, other.clock)
+        self._check_budget()
 
+    def extract(self, keep):
+        """
+        Copies selected nodes into a new tree, together with the paths leading to them, e.g.
+        the nodes a worker process created or computed, to be merged into another tree.
+        :param keep: Predicate on a node; the other nodes are only copied, without their
+                     values, when they lead to a selected node.
+        :return: The new tree, sharing the selected value arrays.
+        """
+        tree = Tree(self.root.key, None, None)
+        tree.clock = self.clock
+        tree.root.last_visit = self.root.last_visit
+        # Depth-first walk; a copied node is attached to its parent's copy once it is kept or has kept descendants
+        stack = [(self.root, tree.root, None, False)]
+        while stack:
+            node, copied, parent, visited = stack.pop()
+            if not visited:
+                stack.append((node, copied, parent, True))
+                if node.children is not None:
+                    for key, child in node.children.items():
+                        child_copy = TreeNode(key, None)
+                        child_copy.last_visit = child.last_visit
+                        stack.append((child, child_copy, copied, False))
+                continue
+            selected = keep(node)
+            if selected and node.value is not None:
+                copied.value = node.value
+                tree.nbytes += node.value.nbytes
+            if parent is not None and (selected or copied.children is not None):
+                if parent.children is None:
+                    parent.children = {}
+                parent.children[copied.key] = copied
+                tree.node_num += 1
+                tree.size += 1
+                tree.nbytes += self.NODE_BYTES
+        return tree
+
+    def report(self):
+        """
+        Returns a short summary of the tree size.
+        """
+        budget = '' if self.max_bytes is None else f" / {self.max_bytes}"
+        return f"tree nodes: {self.size} (created {self.node_num}, evicted {self.evicted}), bytes: {self.nbytes}{budget}"
 
     def display_tree(self, node=None, level=0):
         """
@@ -180,8 +377,393 @@ class Tree:
         if node is None:  # If no node is provided, start from the root
             node = self.root
         print("  " * level + f"{node.key}: {node.value}")  # Print the current node with indentation
-        for child in node.children.values():  # Iterate through all child nodes
+        for child in (node.children or {}).values():  # Iterate through all child nodes
             self.display_tree(child, level + 1)  # Recursively print child nodes with increased indentation
+
+
+def problem_key(matrix, *extra, decimals=10):
+    """
+    Computes a canonical hash of a (reduced) problem matrix.
+
+    Values are rounded so that matrices reached through different elimination orders,
+    which only differ by floating point noise, map to the same key.
+
+    Args:
+        matrix (np.array): The problem matrix.
+        *extra (np.array): Additional arrays (e.g. circuit parameters) that the cached value depends on.
+        decimals (int): Number of decimals kept before hashing.
+
+    Returns:
+        str: Hex digest identifying the problem.
+    """
+    digest = hashlib.sha1()
+    for array in (matrix,) + extra:
+        array = np.round(np.asarray(array, dtype=float), decimals) + 0.0  # drop negative zeros
+        digest.update(str(array.shape).encode())
+        digest.update(array.tobytes())
+    return digest.hexdigest()
+
+
+class TranspositionTable:
+    def __init__(self, max_size=4096):
+        """
+        Initializes an LRU cache of per-problem results, keyed by `problem_key`.
+        Unlike `Tree`, the same reduced problem reached through a different elimination
+        order hits the same entry.
+        :param max_size: Maximum number of entries kept; the least recently used entry is evicted first.
+        """
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """
+        Returns the entry stored under key (marking it as recently used), or None.
+        :param key: The problem key.
+        """
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            return self.entries[key]
+        return None
+
+    def contains(self, key, field):
+        """
+        Returns whether one field of an entry is cached, without touching the LRU order or the counters.
+        :param key: The problem key.
+        :param field: Name of the cached result within the entry.
+        """
+        return key in self.entries and field in self.entries[key]
+
+    def fetch(self, key, field, compute):
+        """
+        Returns one field of an entry, calling compute() and storing its result on a miss.
+        Entries are dicts, so several results of one problem (e.g. expectations and gradients) share a key.
+        :param key: The problem key.
+        :param field: Name of the cached result within the entry.
+        :param compute: Callable producing the result when it is not cached.
+        """
+        entry = self.get(key)
+        if entry is None:
+            entry = {}
+            self.put(key, entry)
+        if field in entry:
+            self.hits += 1
+        else:
+            self.misses += 1
+            entry[field] = compute()
+        return entry[field]
+
+    def put(self, key, value):
+        """
+        Stores value under key, evicting the least recently used entries beyond max_size.
+        :param key: The problem key.
+        :param value: The data to cache.
+        """
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        """
+        Removes all entries.
+        """
+        self.entries.clear()
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class ExpectationStore:
+    def __init__(self, directory):
+        """
+        Initializes a persistent on-disk cache of per-problem results.
+
+        Every (model kind, problem key, field) is stored as its own .npy shard under
+        directory/kind/key[:2]/. Hits are read into memory and the shard is closed, since
+        callers such as `TranspositionTable` keep many results alive and a memory map would
+        hold a file descriptor each. Shards are written to a temporary file and renamed into
+        place, so several processes can share one store.
+        :param directory: Root directory of the store (created if missing).
+        """
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.hits = 0
+        self.misses = 0
+
+    def path(self, kind, key, field):
+        """
+        Returns the shard path of one cached result.
+        :param kind: Model kind, e.g. 'qaoa_p1' or 'qaa'.
+        :param key: The problem key (see `problem_key`).
+        :param field: Name of the cached result.
+        """
+        return os.path.join(self.directory, kind, key[:2], f"{key}.{field}.npy")
+
+    def contains(self, kind, key, field):
+        """
+        Returns whether a result is stored, without loading it or touching the counters.
+        :param kind: Model kind, e.g. 'qaoa_p1' or 'qaa'.
+        :param key: The problem key (see `problem_key`).
+        :param field: Name of the cached result.
+        """
+        return os.path.exists(self.path(kind, key, field))
+
+    def fetch(self, kind, key, field, compute):
+        """
+        Returns a stored result, or calls compute() and stores its result on a miss.
+        :param kind: Model kind, e.g. 'qaoa_p1' or 'qaa'.
+        :param key: The problem key (see `problem_key`).
+        :param field: Name of the cached result.
+        :param compute: Callable producing the result when it is not stored.
+        """
+        path = self.path(kind, key, field)
+        try:
+            value = np.load(path)
+        except FileNotFoundError:
+            self.misses += 1
+            value = compute()
+            self.save(path, value)
+            return value
+        self.hits += 1
+        return value
+
+    def save(self, path, value):
+        """
+        Atomically writes an array to path.
+        :param path: Destination shard path.
+        :param value: The array to store.
+        """
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.save(f, np.asarray(value, dtype=float))
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+    def report(self):
+        """
+        Returns a short summary of the hit and miss counts.
+        """
+        return f"disk cache hits: {self.hits}, misses: {self.misses}"
+
+
+class ParityUnionFind:
+    def __init__(self):
+        """
+        Initializes a union-find structure over nodes carrying a relative sign.
+
+        Every node stores its parent and its sign relative to that parent, so
+        Z_node = parity * Z_parent. With path compression and union by size, recording a
+        constraint Z_i = sign * Z_j and querying the sign between two nodes both take
+        near-constant time, and contradicting constraints are detected as they are added.
+        Nodes are registered on first use.
+        """
+        self.parent = {}
+        self.parity = {}
+        self.size = {}
+
+    def find(self, node):
+        """
+        Returns the representative of a node's component and the node's sign relative to it.
+        :param node: The node (any hashable label).
+        :return: Tuple (representative, sign) with Z_node = sign * Z_representative.
+        """
+        if node not in self.parent:
+            self.parent[node] = node
+            self.parity[node] = 1
+            self.size[node] = 1
+            return node, 1
+        path = []
+        while self.parent[node] != node:
+            path.append(node)
+            node = self.parent[node]
+        # Compress the path, accumulating the signs from the root downwards
+        sign = 1
+        for step in reversed(path):
+            sign *= self.parity[step]
+            self.parent[step] = node
+            self.parity[step] = sign
+        return node, sign
+
+    def union(self, i, j, sign):
+        """
+        Records the constraint Z_i = sign * Z_j.
+        :param i: First node.
+        :param j: Second node.
+        :param sign: 1 if both nodes take the same value, -1 if they take opposite values.
+        :return: True if two components were merged, False if the constraint was already implied.
+        :raises ValueError: If the constraint contradicts the recorded ones.
+        """
+        root_i, sign_i = self.find(i)
+        root_j, sign_j = self.find(j)
+        if root_i == root_j:
+            if sign_i * sign_j != sign:
+                raise ValueError(f"Error: Constraint Z_{i} = {sign} * Z_{j} contradicts earlier constraints.")
+            return False
+        if self.size[root_i] < self.size[root_j]:
+            root_i, root_j = root_j, root_i
+        # Z_root_j = sign_i * sign * sign_j * Z_root_i
+        self.parent[root_j] = root_i
+        self.parity[root_j] = sign_i * sign * sign_j
+        self.size[root_i] += self.size[root_j]
+        return True
+
+    def relative_sign(self, i, j):
+        """
+        Returns s with Z_i = s * Z_j, or None if the nodes are not constrained to each other.
+        """
+        root_i, sign_i = self.find(i)
+        root_j, sign_j = self.find(j)
+        return sign_i * sign_j if root_i == root_j else None
+
+    def components(self):
+        """
+        Groups the registered nodes by component, in order of first registration.
+        :return: dict mapping each representative to a list of (node, sign relative to the representative).
+        """
+        groups = {}
+        for node in list(self.parent):
+            root, sign = self.find(node)
+            groups.setdefault(root, []).append((node, sign))
+        return groups
+
+    def representatives(self, n):
+        """
+        Collapses the nodes 0..n-1 onto free variables, one per component.
+
+        Free variables are numbered by the smallest node of their component, and every
+        sign is taken relative to that node.
+        :param n: Number of nodes.
+        :return: Tuple (reps, signs) of arrays of length n with Z_node = signs[node] * x[reps[node]].
+        """
+        reps = np.zeros(n, dtype=int)
+        signs = np.zeros(n, dtype=int)
+        index = {}
+        for node in range(n):
+            root, sign = self.find(node)
+            if root not in index:
+                index[root] = (len(index), sign)
+            reps[node] = index[root][0]
+            signs[node] = sign * index[root][1]
+        return reps, signs
+
+
+class EdgeIndex:
+    def __init__(self, matrix, nodes, n):
+        """
+        Index of the edges (nonzero off-diagonal entries) of a reduced upper-triangular matrix.
+
+        Every array follows the row-major order of `np.nonzero`, so all consumers of one
+        reduction step (edge selection, the policy gradients, the tree keys and the circuit
+        measurements) see the same edge ordering.
+
+        `flat` maps each edge to its position in the row-major enumeration of the original
+        graph's upper-triangular edges (i < j), which addresses the beta vector. For example,
+        if node 3 is removed from nodes [1, 2, 3, 4, 5], the reduced edge (2, 3) is the
+        original edge (4, 5) and keeps that edge's beta.
+        :param matrix: The reduced upper-triangular matrix.
+        :param nodes: Original node index of every reduced node.
+        :param n: Number of nodes of the original problem.
+        """
+        self.rows, self.cols = np.nonzero(np.triu(matrix, 1))
+        self.orig_rows = nodes[self.rows]
+        self.orig_cols = nodes[self.cols]
+        i, j = self.orig_rows, self.orig_cols
+        self.flat = i * n - i * (i + 1) // 2 + (j - i - 1)
+
+    def __len__(self):
+        return len(self.rows)
+
+
+class ReducedIsing:
+    def __init__(self, Q, normalize=True):
+        """
+        Holds the working Ising matrix of an RQAOA run and reduces it in place.
+
+        The matrix is kept upper triangular (as `zero_lower_triangle` would produce it) in a
+        preallocated n x n buffer. Active nodes stay compacted in the leading block in their
+        original order, so `matrix` is a view of the reduced problem. `nodes` maps reduced
+        indices to original node indices and `active` marks the nodes not yet eliminated.
+        `edges` caches the edge index of the current step.
+        :param Q: The Ising matrix (diagonal: local fields, off-diagonal: couplings).
+        :param normalize: Whether to keep the matrix divided by `off_diagonal_median`.
+        """
+        Q = np.asarray(Q, dtype=float)
+        self.n = Q.shape[0]
+        self.J = np.triu(Q) + np.triu(Q.T, 1)
+        self.nodes = np.arange(self.n)
+        self.active = np.ones(self.n, dtype=bool)
+        self.size = self.n
+        self.normalize = normalize
+        self.scale = 1.0  # Product of the normalization factors applied so far
+        self._edges = None
+        if normalize:
+            self._normalize()
+
+    @property
+    def matrix(self):
+        """
+        The reduced (size x size) upper-triangular matrix, as a view of the working buffer.
+        """
+        return self.J[:self.size, :self.size]
+
+    @property
+    def edges(self):
+        """
+        The `EdgeIndex` of the reduced problem, computed once per reduction step.
+        """
+        if self._edges is None:
+            self._edges = EdgeIndex(self.matrix, self.nodes[:self.size], self.n)
+        return self._edges
+
+    def eliminate(self, k, l, sign):
+        """
+        Applies the constraint Z_k = sign * Z_l and removes node k, in O(size) plus one shift.
+
+        Row and column k are merged into row and column l, keeping the upper-triangular
+        form, and the nodes after k move up by one so the active block stays compacted.
+        :param k: Reduced index of the node to remove.
+        :param l: Reduced index of the node it is merged into.
+        :param sign: 1 if the nodes take the same value, -1 if opposite values.
+        """
+        m, J = self.size, self.J
+        coupling = J[:m, k] + J[k, :m]  # couplings of every node to k (one of the two is zero)
+        coupling[[k, l]] = 0
+        J[l, l] += sign * J[k, k]
+        J[:l, l] += sign * coupling[:l]
+        J[l, l + 1:m] += sign * coupling[l + 1:m]
+
+        J[k:m - 1, :m] = J[k + 1:m, :m]
+        J[:m, k:m - 1] = J[:m, k + 1:m]
+        J[m - 1, :m] = 0
+        J[:m, m - 1] = 0
+        self.active[self.nodes[k]] = False
+        self.nodes[k:m - 1] = self.nodes[k + 1:m]
+        self.size -= 1
+        self._edges = None
+        if self.normalize:
+            self._normalize()
+
+    def _normalize(self):
+        """
+        Divides the active block by its `off_diagonal_median`.
+
+        For an upper-triangular matrix this is the median of the strictly upper entries,
+        which is taken with a vectorized partition over the active block.
+        """
+        m = self.size
+        if m < 2:
+            return
+        median = np.median(self.matrix[np.triu_indices(m, 1)])
+        self.J[:m, :m] /= median
+        self.scale *= median
+
+
 def add_constraint(node_hamming_weights, hamming_weights):
     """
     Adds a Hamming weight constraint to the QUBO formulation.
@@ -204,46 +786,6 @@ def add_constraint(node_hamming_weights, hamming_weights):
     
     return Q
 
-def make_check(list_seq):
-    """
-    Processes the compressed Hamiltonian structure from RQAOA.
-    Given the reduction process in Hamiltonian (e.g., Z1=-Z2=Z3),
-    it generates the compressed values representing node relationships (e.g., Z1=-Z2, Z2=Z3).
-    
-    Args:
-        list_seq (list of lists): Compressed Hamiltonian sequences.
-    
-    Returns:
-        list of lists: Processed compressed node relationships.
-    """
-    list_seq = copy.deepcopy(list_seq)
-    full_list = []
-    add_comp = None
-    for seq in list_seq:
-        if len(full_list) == 0:
-            full_list = [seq]
-        else:
-            break_comp = False
-            seq_test = abs(npo.array(seq))
-            for list_comp in full_list:
-                if break_comp:
-                    break
-                for index, comp in enumerate(list_comp):
-                    if break_comp:
-                        break
-                    for test_idx, test in enumerate(seq_test):
-                        if test == abs(comp):
-                            test = seq.pop(test_idx)
-                            add_comp = npo.sign(test) * npo.sign(comp) * npo.array(seq)
-                            break_comp = True
-                            list_comp += list(add_comp)
-                            break
-    
-        if add_comp is None and len(seq) >= 1:
-            full_list.append(seq)
-        add_comp = None
-    return full_list
-
 def make_node_weights(full_list):
     """
     Computes the Hamming weight adjustments for each node
@@ -311,6 +853,8 @@ def make_check(list_seq):
     Processes the compressed Hamiltonian structure from RQAOA.
     Given the reduction process in Hamiltonian (e.g., Z1=-Z2=Z3),
     it generates the compressed values representing node relationships (e.g., Z1=-Z2, Z2=Z3).
+    The sequences are merged with a `ParityUnionFind`, so sequences that bridge two
+    existing groups join them and every node appears once.
     
     Args:
         list_seq (list of lists): Compressed Hamiltonian sequences.
@@ -318,32 +862,18 @@ def make_check(list_seq):
     Returns:
         list of lists: Processed compressed node relationships.
     """
-    list_seq = copy.deepcopy(list_seq)
-    full_list = []
-    add_comp = None
+    groups = ParityUnionFind()
+    first_sign = {}
     for seq in list_seq:
-        if len(full_list) == 0:
-            full_list = [seq]
-        else:
-            break_comp = False
-            seq_test = abs(npo.array(seq))
-            for list_comp in full_list:
-                if break_comp:
-                    break
-                for index, comp in enumerate(list_comp):
-                    if break_comp:
-                        break
-                    for test_idx, test in enumerate(seq_test):
-                        if test == abs(comp):
-                            test = seq.pop(test_idx)
-                            add_comp = npo.sign(test) * npo.sign(comp) * npo.array(seq)
-                            break_comp = True
-                            list_comp += list(add_comp)
-                            break
-    
-        if add_comp is None and len(seq) >= 1:
-            full_list.append(seq)
-        add_comp = None
+        for label in seq:
+            first_sign.setdefault(abs(label), npo.sign(label))
+            groups.union(abs(seq[0]), abs(label), npo.sign(seq[0]) * npo.sign(label))
+
+    full_list = []
+    for members in groups.components().values():
+        head, head_sign = members[0]
+        orientation = first_sign[head] * head_sign
+        full_list.append([int(orientation * sign * node) for node, sign in members])
     return full_list
 
 def make_node_weights(full_list):
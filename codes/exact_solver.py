@@ -0,0 +1,98 @@
+import numpy as np
+from codes.data_process import ParityUnionFind
+from codes.statevector import spin_table,state_energies
+
+
+def collapse_constraints(same_list, diff_list, n):
+    """
+    Collapses Z_i = Z_j and Z_i = -Z_j constraints into a set of free variables
+    with a `ParityUnionFind`.
+
+    Every node is expressed as sign * x[rep] in terms of the free variables x, so only
+    2**(number of free variables) assignments remain to be searched.
+
+    Args:
+        same_list (list of tuples): Node pairs that must have the same value.
+        diff_list (list of tuples): Node pairs that must have different values.
+        n (int): Total number of nodes.
+
+    Returns:
+        tuple:
+            - np.ndarray: Index of the free variable of every node, length n.
+            - np.ndarray: Sign (+1/-1) relating every node to its free variable, length n.
+
+    Raises:
+        ValueError: If the constraints contradict each other.
+    """
+    constraints = ParityUnionFind()
+    for i, j in same_list:
+        constraints.union(i, j, 1)
+    for i, j in diff_list:
+        constraints.union(i, j, -1)
+    return constraints.representatives(n)
+
+
+def exact_minimum(Q, reps=None, signs=None, block_bits=16):
+    """
+    Finds the minimum of the Ising cost sum_i Q_ii z_i + sum_{i != j} Q_ij z_i z_j exactly.
+
+    The cost is first rewritten in terms of the free variables (see `collapse_constraints`).
+    The last `block_bits` free variables are scored together as one vectorized block of
+    2**block_bits assignments, and the remaining variables are enumerated in Gray-code
+    order, so every step flips one variable and updates the block's linear field in O(n).
+    Only the best assignment is kept, the candidate list is never materialized.
+
+    Args:
+        Q (np.ndarray): Ising matrix (diagonal: local fields, off-diagonal: couplings).
+        reps (np.ndarray, optional): Free variable of every node (default: all nodes are free).
+        signs (np.ndarray, optional): Sign relating every node to its free variable.
+        block_bits (int): Number of free variables scored per vectorized block.
+
+    Returns:
+        tuple:
+            - np.ndarray: Optimal +1/-1 assignment of all n nodes.
+            - float: Its energy.
+    """
+    Q = np.asarray(Q, dtype=float)
+    n = Q.shape[0]
+    if reps is None:
+        reps, signs = np.arange(n), np.ones(n, dtype=int)
+    m = int(np.max(reps)) + 1
+
+    # Express the cost as const + h . x + x^T A x / 2 over the free variables x
+    P = np.zeros((n, m))
+    P[np.arange(n), reps] = signs
+    h = P.T @ np.diag(Q)
+    J = P.T @ (Q - np.diag(np.diag(Q))) @ P
+    const = np.trace(J)
+    A = J + J.T
+    np.fill_diagonal(A, 0)
+
+    b = min(m, block_bits)
+    hi, lo = slice(0, m - b), slice(m - b, m)
+    block = spin_table(b).astype(float)
+    block_energies = state_energies(block, h[lo], 0.5 * A[lo, lo])
+    A_hh, A_lh, h_hi = A[hi, hi], A[lo, hi], h[hi]
+
+    x_hi = np.ones(m - b)
+    energy_hi = h_hi.sum() + 0.5 * A_hh.sum()
+    field = A_lh.sum(axis=1)
+
+    best_value, best_hi, best_lo = np.inf, None, None
+    for step in range(1, 2 ** (m - b) + 1):
+        energies = block_energies + block @ field
+        index = int(np.argmin(energies))
+        if energy_hi + energies[index] < best_value:
+            best_value = energy_hi + energies[index]
+            best_hi, best_lo = x_hi.copy(), index
+        if step == 2 ** (m - b):
+            break
+        # Gray code: flip the variable at the position of the lowest set bit of step
+        k = (step & -step).bit_length() - 1
+        old = x_hi[k]
+        energy_hi -= 2 * old * (h_hi[k] + A_hh[k] @ x_hi)
+        field -= 2 * old * A_lh[:, k]
+        x_hi[k] = -old
+
+    x = np.concatenate((best_hi, block[best_lo]))
+    return (signs * x[reps]).astype(int), float(best_value + const)
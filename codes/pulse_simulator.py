@@ -2,6 +2,8 @@ import copy
 import pennylane as qml
 import pulser
 import scipy.interpolate as interp
+import scipy.linalg
+import scipy.sparse as sparse
 import matplotlib.pyplot as plt
 import numpy as np
 import matplotlib.pyplot as plt
@@ -9,8 +11,10 @@ from pulser import Pulse, Sequence, Register
 from pulser.devices import MockDevice as DigitalAnalogDevice
 from pulser.waveforms import InterpolatedWaveform
 from scipy.optimize import minimize
+from scipy.sparse.linalg import expm_multiply
 from scipy.spatial.distance import pdist, squareform
 from codes.data_process import zero_lower_triangle,qubo_to_ising,off_diagonal_median
+from codes.statevector import ising_energies,apply_qubit_gates,spin_table,zz_correlation_matrix
 
 
 
@@ -23,6 +27,12 @@ class Pulse_simulation:
     - Generates pulse waveforms for amplitude and detuning.
     - Applies interpolation to create continuous pulse functions.
     - Simulates the quantum state evolution over a given duration.
+
+    The time-dependent Hamiltonian is stored as coefficient tensors rather than as
+    one `qml.Hamiltonian` per time step:
+    - `Q_ising`: static ZZ couplings (upper triangle) and static Z fields (diagonal).
+    - `amplitude_t`: (time, qubit) array of interpolated amplitudes.
+    - `detuning_t`: (time, qubit) array of interpolated detunings.
     """
 
     def __init__(self, Q, amplitude, detuning, duration, step_time=50):
@@ -55,20 +65,35 @@ class Pulse_simulation:
 
     def generate_hamiltonians(self):
         """
-        Generates a list of Hamiltonians based on the interpolated pulse values.
+        Generates the coefficient tensors of the time-dependent Hamiltonian from the
+        interpolated pulse values. Only the drive terms depend on time, so the ZZ part
+        is kept once in `Q_ising`.
         """
-        coeffs_ZZ, ops_ZZ, coeffs_Z, ops_Z = Q_to_ham(self.Q_ising)
         amp, detune = self.interpolate_1d()
-        self.ham = []
-        for time in range(len(amp[0])):
+        self.amplitude_t = np.array(amp).T
+        self.detuning_t = np.array(detune).T
+
+    def hamiltonians(self):
+        """
+        Yields the `qml.Hamiltonian` of every time step, built on demand from the coefficient tensors.
+        """
+        coeffs_ZZ, ops_ZZ, coeffs_Z, ops_Z = Q_to_ham(self.Q_ising)
+        for amp, detune in zip(self.amplitude_t, self.detuning_t):
             coeffs = list(coeffs_ZZ)
             ops = list(ops_ZZ)
             for q_index in range(len(amp)):
-                coeffs.append(amp[q_index][time] / 2)
+                coeffs.append(amp[q_index] / 2)
                 ops.append(qml.PauliX(q_index))
-                coeffs.append(detune[q_index][time] / 2 + coeffs_Z[q_index])
+                coeffs.append(detune[q_index] / 2 + coeffs_Z[q_index])
                 ops.append(qml.PauliZ(q_index))
-            self.ham.append(qml.Hamiltonian(coeffs, ops))
+            yield qml.Hamiltonian(coeffs, ops)
+
+    @property
+    def ham(self):
+        """
+        List of the per-step `qml.Hamiltonian` objects.
+        """
+        return list(self.hamiltonians())
 
     def simulate_time_evolution(self):
         """
@@ -78,12 +103,125 @@ class Pulse_simulation:
 
         @qml.qnode(dev)
         def circuit():
-            for H in self.ham:
+            for H in self.hamiltonians():
                 qml.ApproxTimeEvolution(H, self.step_time / 1000, 1)
             return [qml.expval(qml.PauliZ(i)) for i in range(len(self.amplitude))]
 
         return circuit()
 
+    def simulate_statevector(self):
+        """
+        Simulates the same first-order Trotter evolution as `simulate_time_evolution`
+        with a split-operator propagator on a NumPy statevector.
+
+        The ZZ and static Z terms are precomputed once as a diagonal phase vector, and the
+        time-dependent X and Z drive terms are applied as one 2x2 rotation per qubit and step.
+
+        Returns:
+            np.ndarray: Final statevector (PennyLane wire ordering), starting from |0...0>.
+        """
+        gates, phase, field = self.split_operator_terms()
+        return split_operator_evolve(gates, phase, field, len(self.amplitude))
+
+    def split_operator_terms(self):
+        """
+        Precomputes the factors of the split-operator propagator.
+
+        Returns:
+            tuple:
+                - gates: (time, qubit, 2, 2) array of exp(-i phi Z) exp(-i theta X) drive rotations.
+                - phase: diagonal phase vector of the ZZ and static Z terms for one step.
+                - field: diagonal phase vector of the static Z terms alone for one step.
+        """
+        tau = self.step_time / 1000
+        theta = tau * self.amplitude_t / 2
+        phi = tau * self.detuning_t / 2
+
+        gates = np.empty(theta.shape + (2, 2), dtype=complex)
+        gates[..., 0, 0] = np.exp(-1j * phi) * np.cos(theta)
+        gates[..., 0, 1] = -1j * np.exp(-1j * phi) * np.sin(theta)
+        gates[..., 1, 0] = -1j * np.exp(1j * phi) * np.sin(theta)
+        gates[..., 1, 1] = np.exp(1j * phi) * np.cos(theta)
+
+        field = np.exp(-1j * tau * ising_energies(np.diag(np.diag(self.Q_ising))))
+        phase = np.exp(-1j * tau * ising_energies(self.Q_ising))
+        return gates, phase, field
+
+    def adaptive_segments(self, tol):
+        """
+        Splits the pulse into piecewise-constant segments for `simulate_adaptive`.
+
+        A segment is extended while, for every drive coefficient, (max - min) over the
+        segment times the segment length stays below `tol`. Flat parts of the waveform
+        therefore collapse into a single long segment.
+
+        Args:
+            tol (float): Tolerance on the coefficient variation within a segment (rad).
+
+        Returns:
+            list: (start, stop) index pairs into the time grid.
+        """
+        tau = self.step_time / 1000
+        coeffs = np.hstack((self.amplitude_t, self.detuning_t)) / 2
+        segments = []
+        start = 0
+        low = high = coeffs[0]
+        for step in range(1, len(coeffs)):
+            new_low = np.minimum(low, coeffs[step])
+            new_high = np.maximum(high, coeffs[step])
+            if np.max(new_high - new_low) * (step - start + 1) * tau > tol:
+                segments.append((start, step))
+                start = step
+                low = high = coeffs[step]
+            else:
+                low, high = new_low, new_high
+        segments.append((start, len(coeffs)))
+        return segments
+
+    def simulate_adaptive(self, tol=1e-2, dense_qubits=6):
+        """
+        Simulates the pulse with exact (Krylov-type) propagation over adaptive segments.
+
+        Each segment from `adaptive_segments` uses the mean drive coefficients of its time
+        steps and is propagated with `scipy.sparse.linalg.expm_multiply`, so there is no
+        Trotter splitting error and the number of steps follows the tolerance rather than
+        `step_time`. Small systems (up to `dense_qubits` qubits) exponentiate the dense
+        segment Hamiltonian instead, where the Taylor/Krylov overhead dominates.
+        The number of segments actually used is stored in `num_steps_used`.
+
+        Args:
+            tol (float): Tolerance on the coefficient variation within a segment (rad).
+            dense_qubits (int): Largest system size propagated with a dense matrix exponential.
+
+        Returns:
+            np.ndarray: Final statevector (PennyLane wire ordering), starting from |0...0>.
+        """
+        n = len(self.amplitude)
+        dim = 2 ** n
+        tau = self.step_time / 1000
+        spins = spin_table(n)
+        static = ising_energies(self.Q_ising, spins)
+
+        # Fixed sparsity pattern: the diagonal followed by one bit flip per qubit
+        index = np.arange(dim)
+        rows = np.tile(index, n + 1)
+        cols = np.concatenate([index] + [index ^ (1 << (n - 1 - q)) for q in range(n)])
+
+        segments = self.adaptive_segments(tol)
+        state = np.zeros(dim, dtype=complex)
+        state[0] = 1
+        for start, stop in segments:
+            amp = self.amplitude_t[start:stop].mean(axis=0) / 2
+            detune = self.detuning_t[start:stop].mean(axis=0) / 2
+            data = np.concatenate((static + spins @ detune, np.repeat(amp, dim)))
+            H = sparse.csr_matrix((data, (rows, cols)), shape=(dim, dim))
+            if n <= dense_qubits:
+                state = scipy.linalg.expm(-1j * (stop - start) * tau * H.toarray()) @ state
+            else:
+                state = expm_multiply(-1j * (stop - start) * tau * H, state)
+        self.num_steps_used = len(segments)
+        return state
+
     def interpolate_1d(self):
         """
         Performs 1D interpolation on amplitude and detuning values.
@@ -167,6 +305,68 @@ class Pulse_simulation_fixed(Pulse_simulation):
         # Generate Hamiltonians
         self.generate_hamiltonians()
 
+def split_operator_evolve(gates, phase, field, n):
+    """
+    Runs the split-operator Trotter evolution from |0...0> for one or several problems.
+
+    The static Z terms act after the drive in every Trotter step. They commute with the
+    ZZ terms, so they are folded into the next step's diagonal `phase`, and the boundary
+    phases are undone/applied explicitly with `field`.
+
+    Args:
+        gates (np.ndarray): Drive rotations, (time, n, 2, 2) or (time, batch, n, 2, 2).
+        phase (np.ndarray): Diagonal step phases, (2**n,) or (batch, 2**n).
+        field (np.ndarray): Diagonal static-field phases, same shape as `phase`.
+        n (int): Number of qubits.
+
+    Returns:
+        np.ndarray: Final statevector(s), same shape as `phase`.
+    """
+    state = np.zeros(phase.shape, dtype=complex)
+    state[..., 0] = 1
+    state = state / field
+    for step in range(len(gates)):
+        state = apply_qubit_gates(state * phase, gates[step], n)
+    return state * field
+
+
+def simulate_statevector_batch(simulations):
+    """
+    Evolves several pulse simulations of the same size together as one (batch, 2**n) array.
+
+    Args:
+        simulations (list): `Pulse_simulation` instances with equal qubit and time-step counts.
+
+    Returns:
+        np.ndarray: (batch, 2**n) array of final statevectors.
+    """
+    n = len(simulations[0].amplitude)
+    terms = [sim.split_operator_terms() for sim in simulations]
+    if any(len(sim.amplitude) != n or gates.shape != terms[0][0].shape
+           for sim, (gates, _, _) in zip(simulations, terms)):
+        raise ValueError("All simulations in a batch need the same number of qubits and time steps.")
+    gates = np.stack([t[0] for t in terms], axis=1)
+    phase = np.stack([t[1] for t in terms])
+    field = np.stack([t[2] for t in terms])
+    return split_operator_evolve(gates, phase, field, n)
+
+
+def pulse_correlations_batch(qubos, step_time=10):
+    """
+    Runs `Pulse_simulation_fixed` on a stack of same-size QUBO matrices at once.
+
+    Args:
+        qubos (list or np.ndarray): QUBO matrices of equal size.
+        step_time (int): Time step interval for the simulation.
+
+    Returns:
+        np.ndarray: (batch, n, n) stack of <Z_i Z_j> correlation matrices.
+    """
+    simulations = [Pulse_simulation_fixed(Q, step_time) for Q in qubos]
+    states = simulate_statevector_batch(simulations)
+    return zz_correlation_matrix(np.abs(states) ** 2)
+
+
 def create_square_register(N):
     """
     Function to randomly generate a register for Pulser simulation drawing.
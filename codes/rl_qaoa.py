@@ -1,12 +1,18 @@
 import pennylane as qml
 from pennylane import numpy as np
+import numpy as npo
 import torch
 import copy
+import warnings
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from tqdm import tqdm
-from scipy.optimize import minimize
-import torch
-from codes.data_process import Tree,off_diagonal_median,zero_lower_triangle,ising_to_qubo,qubo_to_ising,plot_rl_qaoa_results
-from codes.pulse_simulator import Pulse_simulation_fixed
+from codes.data_process import Tree,edge_key,ParityUnionFind,ReducedIsing,TranspositionTable,ExpectationStore,problem_key,off_diagonal_median,zero_lower_triangle,ising_to_qubo,qubo_to_ising,plot_rl_qaoa_results
+from codes.pulse_simulator import Pulse_simulation_fixed,pulse_correlations_batch
+from codes.statevector import StatevectorQAOA,spin_table,state_energies,zz_correlation_matrix
+from codes.analytic_qaoa import AnalyticQAOA
+from codes.exact_solver import collapse_constraints,exact_minimum
+from codes.rollout import CachedRollout
+from codes.cost_model import as_cost_model
 
 
 class RL_QAOA:
@@ -37,6 +43,49 @@ class RL_QAOA:
     learning_rate_init : float, default=0.001
         Initial learning rate for the Adam optimizer.
 
+    backend : str, default='pennylane'
+        Simulator used for the edge expectations. 'pennylane' builds a QNode from `QAOA_layer`,
+        'numpy' uses the native `StatevectorQAOA` engine, and 'analytic' the closed-form
+        correlations of `AnalyticQAOA` (QAOA_depth == 1 only), which cost O(n) per edge
+        instead of a 2**n statevector.
+
+    grad_method : str, optional
+        How the edge expectation gradients are computed. 'backprop' differentiates the QNode
+        with torch, one backward pass per edge; 'adjoint' computes the whole edge x parameter
+        Jacobian with one reverse sweep of `StatevectorQAOA`; 'analytic' differentiates the
+        closed form of `AnalyticQAOA` (QAOA_depth == 1 only). Defaults to 'adjoint' for the
+        'numpy' backend, 'analytic' for the 'analytic' backend and 'backprop' otherwise.
+
+    cache_size : int, default=4096
+        Maximum number of reduced problems kept in the transposition table shared by
+        `tree` and `tree_grad`.
+
+    store : ExpectationStore or str, optional
+        Persistent on-disk cache (or its directory) consulted behind the transposition table,
+        so results survive across runs and can be shared between processes.
+
+    tree_max_bytes : int, optional
+        Byte budget of each of `tree` and `tree_grad`. Least recently visited subtrees are
+        evicted beyond it; None keeps every node.
+
+    edges_per_step : int, default=1
+        Maximum number of edges cut per evaluation of the edge expectations (see
+        `_select_edges_to_cut`). Larger values need fewer quantum evaluations per episode,
+        at some cost in solution quality. The beta vector and QAOA parameters of a step are
+        then indexed by evaluation rather than by eliminated node.
+
+    cost_model : CostModel, str or bool, optional
+        Calibrated solver costs of the machine, the path of their JSON file, or True for the
+        default file of the machine (`CostModel.for_host`). When given, episodes hand the
+        remaining problem over to the exact solver as soon as enumerating it is predicted to
+        be cheaper than finishing the quantum reductions down to `n_c` (see `_hands_off`).
+        The solvers missing from the model are calibrated on first use.
+
+    max_handoff_size : int, optional
+        Largest problem size handed over to the exact solver by `cost_model`. By default, the
+        largest size both the exact solver and a reduction step were calibrated on, so the
+        decision never relies on extrapolated costs.
+
     Attributes
     ----------
     qaoa_layer : QAOA_layer
@@ -55,13 +104,24 @@ class RL_QAOA:
         Tracks assigned values to the nodes.
 
     """
-
-    def __init__(self, qubo, n_c, init_paramter, b_vector, QAOA_depth, gamma=0.99, learning_rate_init=[0.01,0.05],ising = False):
+    NORMALIZE_STEPS = True  # Whether the reduced problems are divided by their off-diagonal median
+
+    def __init__(self, qubo, n_c, init_paramter, b_vector, QAOA_depth, gamma=0.99, learning_rate_init=[0.01,0.05],ising = False, backend='pennylane', grad_method=None, cache_size=4096, store=None, tree_max_bytes=None, edges_per_step=1, cost_model=None, max_handoff_size=None):
+        if backend not in ('pennylane', 'numpy', 'analytic'):
+            raise ValueError(f"Unknown backend '{backend}'")
+        if grad_method is None:
+            grad_method = {'numpy': 'adjoint', 'analytic': 'analytic'}.get(backend, 'backprop')
+        if grad_method not in ('backprop', 'adjoint', 'analytic'):
+            raise ValueError(f"Unknown grad_method '{grad_method}'")
+        if 'analytic' in (backend, grad_method) and QAOA_depth != 1:
+            raise ValueError("The analytic backend and grad_method require QAOA_depth == 1.")
         if ising:
             Q = qubo
         else:
             Q = qubo_to_ising(qubo)
         self.Q = Q
+        self.fields = np.diag(Q)
+        self.couplings = Q - np.diag(self.fields)
         self.n_c = n_c
         self.param = init_paramter
         self.b = b_vector
@@ -70,16 +130,29 @@ class RL_QAOA:
         self.gamma = gamma
         self.optimzer = AdamOptimizer([init_paramter, b_vector], learning_rate_init=learning_rate_init)
         self.lr = learning_rate_init
-        self.tree = Tree('root',None)
-        self.tree_grad = Tree('root',None)
-
-    def RL_QAOA(self, episodes, epochs,log_interval = 5, correct_ans=None):
+        self.tree_max_bytes = tree_max_bytes
+        self.tree = Tree('root',None,tree_max_bytes)
+        self.tree_grad = Tree('root',None,tree_max_bytes)
+        self.backend = backend
+        self.grad_method = grad_method
+        self.table = TranspositionTable(cache_size)
+        self.store = ExpectationStore(store) if isinstance(store, str) else store
+        self.rng = None  # Generator used to sample edges; None uses the global np.random state
+        self.edges_per_step = edges_per_step
+        self.cost_model = as_cost_model(cost_model)
+        self.max_handoff_size = max_handoff_size
+        self.propagation_steps = []  # Segments used by every 'krylov' evaluation of the current epoch
+        self.handoff_size = n_c  # Size at which the last episode handed over to the exact solver
+
+    def RL_QAOA(self, episodes, epochs,log_interval = 5, correct_ans=None, workers=1, seed=None, batch_misses=False, vectorized=False, exact_max_nodes=None):
         self.avg_values = []
         self.min_values = []
         self.prob_values = []
         self.best_states = []
         self.best_same_lists = []
         self.best_diff_lists = []
+        self.handoff_sizes = []
+        self.step_counts = []
 
         """
         Performs the reinforcement learning optimization process with progress tracking.
@@ -94,64 +167,95 @@ class RL_QAOA:
 
         correct_ans : float, optional
             The correct optimal solution (if available) to calculate success probability.
+
+        workers : int, default=1
+            Number of processes running the episodes of an epoch. Each worker receives a
+            snapshot of the trees, and the nodes it computes are merged back after the epoch.
+
+        seed : int, optional
+            Master seed. Every episode samples from its own stream derived from it, so runs
+            are reproducible for any number of workers. Without a seed (and with one worker)
+            the global np.random state is used.
+
+        batch_misses : bool, default=False
+            Runs the episodes of an epoch in lockstep in this process. Every episode is rolled
+            out until it needs a result missing from the trees; the pending subproblems are
+            then deduplicated and evaluated together (on `workers` threads, or with the batched
+            simulator of the backend) before the episodes resume.
+
+        vectorized : bool, default=False
+            Rolls out all episodes of an epoch at once over the cached part of `tree` with
+            `CachedRollout`. This pays off when the tree is kept across epochs, i.e. when the
+            QAOA parameters are frozen (lr[0] == 0, as in `RL_QAA`). Episodes leaving the cached
+            tree are finished as with `batch_misses`.
+
+        exact_max_nodes : int, optional
+            Enables the exact mode: as long as the tree reachable under the policy has at most
+            this many nodes, every epoch expands it (evaluating the missing nodes) and computes
+            the expected reward, the success probability and the expected beta update exactly
+            with `CachedRollout.exact`, instead of sampling `episodes` episodes. Larger trees
+            fall back to sampling. Requires frozen QAOA parameters (lr[0] == 0).
         """
+        if self.n_c >= self.Q.shape[0]:
+            raise ValueError("Training requires n_c to be smaller than the problem size.")
+        if exact_max_nodes is not None and self.lr[0] != 0:
+            raise ValueError("The exact mode requires frozen QAOA parameters (lr[0] == 0).")
+        if (vectorized or exact_max_nodes is not None) and self.edges_per_step > 1:
+            raise ValueError("The vectorized and exact modes require edges_per_step == 1.")
+        if (vectorized or exact_max_nodes is not None) and self.cost_model is not None:
+            raise ValueError("The vectorized and exact modes require a fixed n_c (cost_model=None).")
+        if self.cost_model is not None:
+            self._handoff_costs()  # Calibrate once, before the model is copied to any worker
+        seeds = npo.random.SeedSequence(seed) if seed is not None or workers > 1 else None
+        if workers <= 1:
+            pool = None
+        elif batch_misses or vectorized or exact_max_nodes is not None:
+            pool = ThreadPoolExecutor(workers)
+        else:
+            self.worker_delta = None
+            pool = ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(self._worker_copy(),))
 
+        try:
+            self._train(episodes, epochs, log_interval, correct_ans, seeds, pool, workers, batch_misses, vectorized, exact_max_nodes)
+        finally:
+            if pool is not None:
+                pool.shutdown()
+
+    def _train(self, episodes, epochs, log_interval, correct_ans, seeds, pool, workers, batch_misses=False, vectorized=False, exact_max_nodes=None):
+        """
+        Runs the epochs of `RL_QAOA`.
+        """
         for j in range(epochs):
 
             if self.lr[0] != 0:
                 num = self.tree.node_num
 
-                self.tree = Tree('root',None)
+                self.tree = Tree('root',None,self.tree_max_bytes)
                 self.tree.node_num = num
-                self.tree_grad = Tree('root',None)
+                self.tree_grad = Tree('root',None,self.tree_max_bytes)
                 self.tree_grad.node_num = num
-            value_list = []
-            state_list = []
-            QAOA_diff_list = []
-            beta_diff_list = []
-            same_lists = []
-            diff_lists = []
-
-            if correct_ans is not None:
-                prob = 0
-
-            # Progress bar for episodes within the current epoch
-            for i in tqdm(range(episodes), desc=f'Epoch {j + 1}/{epochs}', unit=' episode'):
-                QAOA_diff, beta_diff, value, final_state, same_list, diff_list = self.rqaoa_execute()
-                value_list.append(value)
-                state_list.append(final_state)
-                same_lists.append(same_list)
-                diff_lists.append(diff_list)
-                QAOA_diff_list.append(QAOA_diff)
-                beta_diff_list.append(beta_diff)
-
-                if correct_ans is not None and correct_ans - 0.01 <= value <= correct_ans + 0.01:
-                    prob += 1
-
-            # Compute softmax rewards and normalize
-
-            batch_mean = (np.array(value_list) - np.mean(value_list))
-            #batch_plus = np.where(batch_mean < 0, batch_mean, 0)
-            #softmaxed_rewards = signed_softmax_rewards(batch_plus, beta=15)*episodes
-            for index, val in enumerate(batch_mean):
-                QAOA_diff_list[index] *= -batch_mean[index]
-                beta_diff_list[index] *= -batch_mean[index]
-
-            # Compute parameter updates
-            QAOA_diff_sum = np.mean(QAOA_diff_list, axis=0)
-            beta_diff_sum = np.mean(beta_diff_list, axis=0)
-            value_sum = np.mean(value_list)
-            min_value = np.min(value_list)  # Find the lowest reward value
-            min_index = np.argmin(value_list)  # Index of lowest reward value
+                self.table.clear()
+
+            desc = f'Epoch {j + 1}/{epochs}'
+            self.propagation_steps = []
+            epoch = None
+            if exact_max_nodes is not None:
+                epoch = self._exact_epoch(exact_max_nodes, correct_ans, pool)
+            if epoch is None:
+                episode_seeds = None if seeds is None else seeds.spawn(episodes)
+                epoch = self._sampled_epoch(episodes, episode_seeds, pool, workers, batch_misses, vectorized, desc, correct_ans)
+
+            value_sum, min_value, prob = epoch['value'], epoch['min_value'], epoch['prob']
             # Store values
             self.avg_values.append(value_sum)
             self.min_values.append(min_value)
             if correct_ans is not None:
-                prob /= episodes
                 self.prob_values.append(prob)
-            self.best_states.append(state_list[min_index])
-            self.best_same_lists.append(same_lists[min_index][:3])  # Store top 3 same list elements
-            self.best_diff_lists.append(diff_lists[min_index][:3])  # Store top 3 diff list elements
+            self.best_states.append(epoch['best_state'])
+            self.best_same_lists.append(epoch['best_same_list'][:3])  # Store top 3 same list elements
+            self.best_diff_lists.append(epoch['best_diff_list'][:3])  # Store top 3 diff list elements
+            self.handoff_sizes.append(epoch['handoffs'])
+            self.step_counts.append(self.propagation_steps)
 
             # Print optimization progress
             if j % log_interval == 0:
@@ -160,16 +264,268 @@ class RL_QAOA:
                 print(f'  Average reward: {value_sum}')
                 print(f'  Lowest reward obtained: {min_value}')
                 print(f'  Best state at lowest value: {self.best_states[-1]}')
+                if self.cost_model is not None:
+                    print(f'  Handoff sizes (size: episodes): {self.handoff_sizes[-1]}')
+                if self.propagation_steps:
+                    print(f'  Propagation segments per evaluation: mean {npo.mean(self.propagation_steps):.1f}, '
+                          f'max {max(self.propagation_steps)} ({len(self.propagation_steps)} evaluations)')
                 print(f'  number of nodes : {self.tree.node_num}')
+                print(f'  {self.tree.report()}')
+                if self.store is not None:
+                    print(f'  {self.store.report()}')
                 #print(f'  Top 3 same constraints: {self.best_same_lists[-1]}')
                 #print(f'  Top 3 different constraints: {self.best_diff_lists[-1]}')
+            if self.cost_model is not None and epoch['handoffs'] and min(epoch['handoffs']) > self.n_c:
+                warnings.warn(
+                    f'Epoch {j + 1}: every episode handed over to the exact solver before n_c '
+                    f'(sizes {epoch["handoffs"]}), so the policy is only trained on the steps '
+                    f'above these sizes.'
+                )
 
 
             # Update parameters using the Adam optimizer
-            update = self.optimzer.get_updates([QAOA_diff_sum, beta_diff_sum])
+            update = self.optimzer.get_updates([epoch['QAOA_diff'], epoch['beta_diff']])
             self.param += np.array(update[0])
             self.b += np.array(update[1])
 
+    def _sampled_epoch(self, episodes, seeds, pool, workers, batch_misses, vectorized, desc, correct_ans):
+        """
+        Estimates the statistics and the parameter updates of one epoch from sampled episodes.
+
+        The episodes are streamed into an `EpisodeAccumulator`, so only the running sums and
+        the best trajectory are kept.
+
+        Returns
+        -------
+        dict
+            'value' (average reward), 'min_value', 'prob' (success rate, None without
+            `correct_ans`), 'best_state', 'best_same_list', 'best_diff_list', the
+            updates 'QAOA_diff' and 'beta_diff', and 'handoffs', the number of episodes
+            handed over to the exact solver at each size.
+        """
+        accumulator = EpisodeAccumulator(correct_ans)
+        if vectorized:
+            self._run_episodes_vectorized(episodes, seeds, pool, desc, accumulator)
+        elif batch_misses:
+            self._run_episodes_batched(episodes, seeds, pool, desc, accumulator)
+        else:
+            self._run_episodes(episodes, seeds, pool, workers, desc, accumulator)
+        return accumulator.epoch()
+
+    def _exact_epoch(self, max_nodes, correct_ans, pool):
+        """
+        Computes the statistics and the beta update of one epoch exactly with
+        `CachedRollout.exact`, or returns None when the reachable tree exceeds `max_nodes`.
+
+        The beta update is the expectation of the one estimated by `_sampled_epoch`, i.e.
+        minus the covariance of the reward and the discounted score.
+        """
+        result = self._cached_rollout().exact(max_nodes, correct_ans, pool)
+        if result is None:
+            return None
+        best = result['best']
+        return {
+            'value': result['value'],
+            'min_value': best.value,
+            'prob': result['prob'],
+            'best_state': np.array(best.state),
+            'best_same_list': list(best.same_list),
+            'best_diff_list': list(best.diff_list),
+            'QAOA_diff': np.zeros_like(self.param),
+            'beta_diff': -result['beta_grad'],
+            'handoffs': None,
+        }
+
+    def _cached_rollout(self):
+        """
+        Returns the `CachedRollout` of the model, created on first use.
+        """
+        if getattr(self, 'rollout', None) is None:
+            self.rollout = CachedRollout(self, self.NORMALIZE_STEPS)
+        return self.rollout
+
+    def _worker_copy(self):
+        """
+        Returns the copy of the model installed once in every worker process: the problem,
+        the settings and the simulators, with a read-only snapshot of the trees and of the
+        transposition table. The parameters are copied, since workers may start after
+        they have been updated in place and compare them to tell whether the snapshot is valid.
+        """
+        model = copy.copy(self)
+        model.param = copy.deepcopy(self.param)
+        model.b = copy.deepcopy(self.b)
+        model.rollout = None
+        model.worker_delta = None
+        return model
+
+    def _run_episodes(self, episodes, seeds, pool, workers, desc, accumulator):
+        """
+        Runs the episodes of one epoch, in this process or split over a process pool.
+
+        Parameters
+        ----------
+        episodes : int
+            Number of episodes.
+
+        seeds : list of np.random.SeedSequence, optional
+            One seed per episode; None samples from the global np.random state.
+
+        pool : ProcessPoolExecutor, optional
+            Pool running the episodes, holding a `_worker_copy` of the model in every worker,
+            whose caches are kept across tasks while the QAOA parameters are unchanged.
+            Tasks carry the current parameters and the tree nodes computed by all workers
+            in the previous epoch (`worker_delta`), so their size does not grow with the
+            caches. Every task sends back the nodes it computed, which are merged into
+            `tree` and `tree_grad`.
+
+        workers : int
+            Number of tasks the episodes are split into.
+
+        desc : str
+            Label of the progress bar.
+
+        accumulator : EpisodeAccumulator
+            Receives the results of `rqaoa_execute`. Every task fills its own accumulator,
+            and they are merged in episode order.
+        """
+        if pool is None:
+            # Progress bar for episodes within the current epoch
+            for i in tqdm(range(episodes), desc=desc, unit=' episode'):
+                if seeds is not None:
+                    self.rng = npo.random.default_rng(seeds[i])
+                accumulator.add(i, self.rqaoa_execute(), self.handoff_size)
+            self.rng = None
+            return
+
+        # The nodes merged in the previous epoch are only valid for the parameters they were computed with
+        delta = None
+        if self.worker_delta is not None and npo.array_equal(self.worker_delta[0], self.param):
+            delta = self.worker_delta[1:]
+        chunks = [chunk for chunk in npo.array_split(npo.arange(episodes), workers) if len(chunk)]
+        futures = {
+            pool.submit(
+                _rollout_episodes, self.param, self.b, self.tree.clock, delta, chunk.tolist(), [seeds[i] for i in chunk],
+                EpisodeAccumulator(accumulator.correct_ans),
+            ): c
+            for c, chunk in enumerate(chunks)
+        }
+        partials = [None] * len(chunks)
+        merged = Tree('root',None), Tree('root',None)
+        with tqdm(total=episodes, desc=desc, unit=' episode') as bar:
+            for future in as_completed(futures):
+                partials[futures[future]], tree, tree_grad, steps = future.result()
+                self.propagation_steps.extend(steps)
+                # Merge copies into the delta, since merging grafts the subtrees of the given tree
+                merged[0].merge(copy.deepcopy(tree))
+                merged[1].merge(copy.deepcopy(tree_grad))
+                self.tree.merge(tree)
+                self.tree_grad.merge(tree_grad)
+                bar.update(len(chunks[futures[future]]))
+        self.worker_delta = (copy.deepcopy(self.param),) + merged
+        for partial in partials:
+            accumulator.merge(partial)
+
+    def _run_episodes_batched(self, episodes, seeds, pool, desc, accumulator, prefixes=None, indices=None):
+        """
+        Runs the episodes of one epoch in lockstep, evaluating their tree misses in batches.
+
+        Every episode runs until it needs a result missing from `tree` or `tree_grad`. The
+        pending requests are resolved together by `_resolve_batch`, so a subproblem needed by
+        several episodes is computed once, and then every episode is resumed. The byte budget
+        of the trees is only enforced once all episodes have finished, since the paths of
+        suspended episodes must not be evicted.
+
+        Parameters
+        ----------
+        episodes : int
+            Number of episodes.
+
+        seeds : list of np.random.SeedSequence, optional
+            One seed per episode; None samples from the global np.random state.
+
+        pool : ThreadPoolExecutor, optional
+            Pool evaluating the pending requests of a batch.
+
+        desc : str
+            Label of the progress bar.
+
+        accumulator : EpisodeAccumulator
+            Receives the results of `rqaoa_execute` as the episodes finish.
+
+        prefixes : list, optional
+            Edge indices every episode cuts first instead of sampling them.
+
+        indices : list, optional
+            Episode indices passed to the accumulator (default: 0 to episodes - 1).
+        """
+        pending = {}
+        budgets = self.tree.max_bytes, self.tree_grad.max_bytes
+        self.tree.max_bytes = self.tree_grad.max_bytes = None
+
+        with tqdm(total=episodes, desc=desc, unit=' episode') as bar:
+            def advance(i, episode, value):
+                try:
+                    pending[i] = (episode, episode.send(value))
+                except StopIteration as stop:
+                    pending.pop(i, None)
+                    accumulator.add(i if indices is None else indices[i], stop.value, self.handoff_size)
+                    bar.update(1)
+
+            for i in range(episodes):
+                if seeds is not None:
+                    self.rng = npo.random.default_rng(seeds[i])
+                advance(i, self._episode(actions=None if prefixes is None else prefixes[i]), None)
+            while pending:
+                batch = list(pending.items())
+                values = self._resolve_batch([request for _, (_, request) in batch], pool)
+                for (i, (episode, _)), value in zip(batch, values):
+                    advance(i, episode, value)
+
+        self.rng = None
+        self.tree.max_bytes, self.tree_grad.max_bytes = budgets
+        self.tree._check_budget()
+        self.tree_grad._check_budget()
+
+    def _run_episodes_vectorized(self, episodes, seeds, pool, desc, accumulator):
+        """
+        Runs the episodes of one epoch with `CachedRollout`, finishing the episodes that leave
+        the cached tree with `_run_episodes_batched`.
+
+        Parameters
+        ----------
+        episodes : int
+            Number of episodes.
+
+        seeds : list of np.random.SeedSequence, optional
+            One seed per episode; the rollout noise is drawn from a stream spawned from the
+            first one. None samples from the global np.random state.
+
+        pool : ThreadPoolExecutor, optional
+            Pool evaluating the tree misses of the escaped episodes.
+
+        desc : str
+            Label of the progress bar.
+
+        accumulator : EpisodeAccumulator
+            Receives the episodes, the rolled out ones as one batch.
+        """
+        rng = None if seeds is None else npo.random.default_rng(seeds[0].spawn(1)[0])
+        run = self._cached_rollout().run(episodes, rng)
+
+        escaped = run['escaped']
+        finished = npo.setdiff1d(npo.arange(episodes), escaped)
+        accumulator.add_batch(
+            finished, npo.zeros((len(finished), len(self.param))), run['beta_diffs'][finished],
+            run['values'][finished], run['states'][finished],
+            [run['same_lists'][i] for i in finished], [run['diff_lists'][i] for i in finished],
+            self.n_c,
+        )
+        if len(escaped):
+            self._run_episodes_batched(
+                len(escaped), None if seeds is None else [seeds[i] for i in escaped], pool, desc,
+                accumulator, run['prefixes'], escaped.tolist()
+            )
+
     def rqaoa_execute(self, cal_grad=True):
         """
         Executes the RQAOA algorithm by iteratively reducing the QUBO problem.
@@ -185,11 +541,43 @@ class RL_QAOA:
             If cal_grad is True, returns gradients, value, and final state.
             Otherwise, returns only the final value.
         """
+        return self._drive(self._episode(cal_grad))
+
+    def _drive(self, episode):
+        """
+        Runs an episode generator to completion, resolving each of its requests immediately.
 
-        Q_init = copy.deepcopy(self.Q)
-        Q_action = copy.deepcopy(self.Q)
+        Parameters
+        ----------
+        episode : generator
+            An episode from `_episode`.
+
+        Returns
+        -------
+        object
+            The return value of the episode.
+        """
+        try:
+            request = next(episode)
+            while True:
+                request = episode.send(self._resolve(request))
+        except StopIteration as stop:
+            return stop.value
+
+    def _episode(self, cal_grad=True, actions=None):
+        """
+        Generator running one episode of `rqaoa_execute`.
+
+        Whenever a result is missing from `tree` or `tree_grad`, it yields the request built by
+        `_request` and expects the resolved result to be sent back; the return value is the
+        one of `rqaoa_execute`. The first steps cut the edges listed in `actions`, if given,
+        instead of sampling them.
+        """
+
+        reduced = ReducedIsing(self.Q, normalize=self.NORMALIZE_STEPS)
         self.same_list = []
         self.diff_list = []
+        self.constraints = ParityUnionFind()
         self.node_assignments = {}
         self.edge_expectations = []
         self.edge_expectations_grad = []
@@ -202,22 +590,29 @@ class RL_QAOA:
 
 
 
-        while Q_init.shape[0] > self.n_c:
-            Q_init = zero_lower_triangle(Q_init)/off_diagonal_median(zero_lower_triangle(Q_init)) * 1 ## Normalization
+        while reduced.size > self.n_c:
+            if index > 0 and self._hands_off(reduced.size, self.tree.state.value is not None):
+                break
+            Q_init = reduced.matrix  # normalized by off_diagonal_median
+            edges = reduced.edges
             if self.b.ndim == 1:
                 self.beta = self.b
             else:
                 self.beta = self.b[index]
 
 
+            param_idx = [i for i in range(self.p * index * 2, self.p * index * 2 + 2 * self.p)]
             if self.tree.state.value is None:
-                edge_expectations = self._qaoa_edge_expectations(
-                    Q_init, [i for i in range(self.p * index * 2, self.p * index * 2 + 2 * self.p)]
-                )
-                self.tree.state.value = edge_expectations
+                edge_expectations = yield from self._await(self._expectations_request(Q_init, index))
+                edge_expectations = self.tree.set_value(edge_expectations)
             else:
                 edge_expectations = self.tree.state.value
-            selected_edge_idx, policy, edge_res = self._select_edge_to_cut(Q_action, edge_expectations)
+            count = min(self.edges_per_step, reduced.size - self.n_c)
+            if count > 1:
+                selected_edge_idx, policy, edge_res = self._select_edges_to_cut(edges, edge_expectations, count)
+            else:
+                action = None if actions is None or index >= len(actions) else actions[index]
+                selected_edge_idx, policy, edge_res = self._select_edge_to_cut(edges, edge_expectations, action)
 
             if cal_grad:
                 """ edge_res_grad = self._qaoa_edge_expectations_gradient(
@@ -225,52 +620,57 @@ class RL_QAOA:
                 ) """
                 if self.lr[0] != 0:
                     if self.tree_grad.state.value is None:
-                        edge_res_grad = self._qaoa_edge_expectations_gradients(
-                            Q_init, [i for i in range(self.p * index * 2, self.p * index * 2 + 2 * self.p)]
-                        )
-                        self.tree_grad.state.value = edge_res_grad
-                        self._tree_action(self.tree_grad, edge_expectations,selected_edge_idx,Q_init)
+                        edge_res_grad = yield from self._await(self._request(
+                            'gradients', lambda: self._qaoa_edge_expectations_gradients(Q_init, param_idx, edges), Q_init, param_idx
+                        ))
+                        edge_res_grad = self.tree_grad.set_value(edge_res_grad)
+                        self._tree_action(self.tree_grad, edge_res,selected_edge_idx,edges)
 
                     else:
                         edge_res_grad = self.tree_grad.state.value
-                        self._tree_action(self.tree_grad, edge_expectations,selected_edge_idx,Q_init)
+                        self._tree_action(self.tree_grad, edge_res,selected_edge_idx,edges)
 
 
 
                 if self.lr[0] != 0:
-                    QAOA_diff = self._compute_log_pol_diff(
-                        selected_edge_idx, Q_action, edge_res, edge_res_grad, policy
+                    QAOA_diff = np.zeros_like(self.param)
+                    QAOA_diff[param_idx] = self._compute_log_pol_diff(
+                        selected_edge_idx, edges, edge_res, edge_res_grad, policy
                     ) * self.gamma ** (Q_init.shape[0] - index)
 
                 else:
                     QAOA_diff = np.zeros_like(self.param)
 
-                beta_diff = self._compute_grad_beta(selected_edge_idx, Q_action, policy, edge_res) * self.gamma ** (Q_init.shape[0] - index)
+                beta_diff = self._compute_grad_beta(selected_edge_idx, edges, policy, edge_res) * self.gamma ** (Q_init.shape[0] - index)
                 QAOA_diff_list.append(QAOA_diff)
                 beta_diff_list.append(beta_diff)
 
-            Q_init, Q_action = self._cut_edge(selected_edge_idx, edge_res, Q_action, Q_init)
+            self._cut_edge(selected_edge_idx, edge_res, reduced)
             index += 1
 
+        self.handoff_size = reduced.size
         self.tree.reset_state()
         self.tree_grad.reset_state()
         # Solve smaller problem using brute force
         self._brute_force_optimal()
-        Value = self._state_energy(np.array(self.node_assignments), self.Q)
+        Value = self._state_energies([self.node_assignments])[0]
 
         # Copy lists to preserve their state
         same_list_copy = copy.deepcopy(self.same_list)
         diff_list_copy = copy.deepcopy(self.diff_list)
 
         if self.n_c != self.Q.shape[0]:
-            QAOA_diff = np.sum(QAOA_diff_list, axis=0)
+            QAOA_diff = np.sum(QAOA_diff_list, axis=0) if QAOA_diff_list else np.zeros_like(self.param)
         else:
             QAOA_diff = None
         if self.n_c != self.Q.shape[0]:
             if self.b.ndim == 1:
-                beta_diff = np.sum(beta_diff_list, axis=0)
+                beta_diff = np.sum(beta_diff_list, axis=0) if beta_diff_list else np.zeros(self.b.shape)
             else:
-                beta_diff = np.stack(beta_diff_list, axis=0)
+                # One row per evaluation; rows of b beyond the last evaluation get no gradient
+                beta_diff = np.zeros(self.b.shape)
+                if beta_diff_list:
+                    beta_diff[:len(beta_diff_list)] = np.stack(beta_diff_list, axis=0)
         else:
             beta_diff = None
 
@@ -282,44 +682,95 @@ class RL_QAOA:
         else:
             return Value
 
-    def _select_edge_to_cut(self, Q_action, edge_expectations):
+    def _select_edge_to_cut(self, edges, correlations, action=None):
         """
         Selects an edge to be cut based on a softmax probability distribution over interactions.
 
         Parameters
         ----------
-        Q_action : np.ndarray
-            Current QUBO matrix tracking active nodes.
+        edges : EdgeIndex
+            Edge index of the reduced problem.
 
+        correlations : np.ndarray
+            Matrix of ZZ expectation values of the reduced problem.
 
-        edge_expectations : list
-            Expectation values of ZZ interactions for all edges.
+        action : int, optional
+            Edge to select instead of sampling one.
 
         Returns
         -------
         tuple
-            Index of selected edge, probability distribution, expectation values.
+            Index of selected edge, probability distribution, expectation values of all edges.
         """
-        action_space = self._action_space(Q_action)
+        action_space = edges.flat
+        edge_expectations = correlations[edges.rows, edges.cols]
 
         try:
-            #value = abs(np.array(edge_expectations))
-
-            #value = value - np.amax(value)
             interactions = abs(np.array(edge_expectations)) * self.beta[action_space]
-            #interactions -= np.amax(interactions)
-        except:
-            print(abs(np.array(edge_expectations)), self.b[action_space])
-            raise ValueError("Invalid input", action_space, abs(np.array(edge_expectations)))
+        except IndexError as err:
+            raise ValueError(
+                f"The beta vector has {len(self.beta)} entries, too few for the edges {action_space}."
+            ) from err
         max_value = np.max(interactions)
         safe_interactions = interactions - max_value
         exp_interactions = np.exp(safe_interactions)
         probabilities = exp_interactions/np.sum(exp_interactions)
         #probabilities = torch.softmax(torch.tensor(interactions), dim=0).numpy()
-        selected_edge_idx = np.random.choice(len(probabilities), p=probabilities)
+        if action is not None:
+            return action, probabilities, edge_expectations
+        rng = np.random if self.rng is None else self.rng
+        selected_edge_idx = rng.choice(len(probabilities), p=probabilities)
 
         return selected_edge_idx, probabilities, edge_expectations
-    def _compute_log_pol_diff(self, idx, Q_action, edge_expectations, edge_expectations_grad, policy):
+    def _select_edges_to_cut(self, edges, correlations, count):
+        """
+        Selects up to `count` edges to be cut on the same expectations, sampling them one after
+        the other without replacement from the softmax policy.
+
+        Only edges joining two different components of the edges selected so far are
+        eligible, so the selected edges form a forest: their constraints never conflict and
+        each one eliminates exactly one node. The log-probability of the selection is
+        sum_t [x_{e_t} - log sum_{eligible at t} exp(x)], so its score is
+        sum_t (onehot_{e_t} - policy_t), which the gradient functions compute from the
+        selected indices and the summed policies.
+
+        Parameters
+        ----------
+        edges : EdgeIndex
+            Edge index of the reduced problem.
+
+        correlations : np.ndarray
+            Matrix of ZZ expectation values of the reduced problem.
+
+        count : int
+            Maximum number of edges to select.
+
+        Returns
+        -------
+        tuple
+            Indices of the selected edges in selection order, sum of the policies of the
+            successive draws, expectation values of all edges.
+        """
+        edge_expectations = correlations[edges.rows, edges.cols]
+        interactions = npo.abs(npo.asarray(edge_expectations, dtype=float)) * npo.asarray(self.beta)[edges.flat]
+        component = npo.arange(correlations.shape[0])
+        policy_sum = npo.zeros(len(interactions))
+        selected = []
+        rng = np.random if self.rng is None else self.rng
+        for _ in range(count):
+            eligible = component[edges.rows] != component[edges.cols]
+            if not eligible.any():
+                break
+            logits = npo.where(eligible, interactions, -npo.inf)
+            probabilities = npo.exp(logits - npo.max(logits))
+            probabilities /= npo.sum(probabilities)
+            idx = int(rng.choice(len(probabilities), p=probabilities))
+            selected.append(idx)
+            policy_sum += probabilities
+            component[component == component[edges.cols[idx]]] = component[edges.rows[idx]]
+        return npo.array(selected), policy_sum, edge_expectations
+
+    def _compute_log_pol_diff(self, idx, edges, edge_expectations, edge_expectations_grad, policy):
         """
         Computes the gradient of the log-policy for the selected edge.
 
@@ -328,8 +779,8 @@ class RL_QAOA:
         idx : int
             Index of the selected edge.
 
-        Q_action : np.ndarray
-            QUBO matrix representing the current optimization problem.
+        edges : EdgeIndex
+            Edge index of the reduced problem the edge was selected from.
 
         edge_expectations : list
             Expectation values of ZZ interactions for all edges.
@@ -343,27 +794,16 @@ class RL_QAOA:
         Returns
         -------
         np.array
-            The computed gradient of the log-policy.
+            The computed gradient of the log-policy with respect to the active QAOA parameters.
         """
-        action_space = self._action_space(Q_action)
-        betas = self.beta[action_space]
-        gather = np.zeros_like(policy)
-
-        # Compute the weighted sum of policy and betas
-        for i in range(len(edge_expectations_grad)):
-            gather[i] += policy[i] * betas[i]
-
-        diff_log_pol = betas[idx] * np.sign(edge_expectations[idx]) * edge_expectations_grad[idx]
-
-        # Adjust the gradient with respect to policy values
-        for i in range(len(gather)):
-            if gather[i]:
-                diff_log_pol -= gather[i] * np.sign(edge_expectations[i]) * edge_expectations_grad[i]
-
-        return np.array(diff_log_pol)
+        # d log pi(idx) / d<ZZ>_e = beta_e * sign(<ZZ>_e) * (onehot - policy)_e, chained with the Jacobian
+        weights = -np.array(policy)
+        weights[idx] += 1
+        weights *= self.beta[edges.flat] * np.sign(edge_expectations)
+        return np.array(weights @ np.asarray(edge_expectations_grad))
 
 
-    def _compute_grad_beta(self, idx, Q_action, policy, edge_expectations):
+    def _compute_grad_beta(self, idx, edges, policy, edge_expectations):
         """
         Computes the gradient of the beta parameter.
 
@@ -372,8 +812,8 @@ class RL_QAOA:
         idx : int
             Index of the selected edge.
 
-        Q_action : np.ndarray
-            QUBO matrix representing the current optimization problem.
+        edges : EdgeIndex
+            Edge index of the reduced problem the edge was selected from.
 
         policy : list
             Probability distribution over edges for selection.
@@ -386,71 +826,54 @@ class RL_QAOA:
         np.array
             The computed gradient of the beta parameter.
         """
-        abs_expectations = abs(np.array(edge_expectations))
-        action_space = self._action_space(Q_action)
-
-        betas_idx = action_space
+        weights = -np.array(policy)
+        weights[idx] += 1
         grad = np.zeros(len(self.beta))
+        # Each edge owns a distinct beta, so the score |<ZZ>| * (onehot - policy) scatters directly
+        grad[edges.flat] = weights * abs(np.array(edge_expectations))
+        return grad
 
-        grad[betas_idx[idx]] += abs_expectations[idx]
-
-        # Compute gradient by adjusting with policy values
-        for i in range(len(action_space)):
-            grad[betas_idx[i]] -= policy[i] * abs_expectations[i]
-
-        return np.array(grad)
-
-    def _cut_edge(self, selected_edge_idx, expectations, Q_action, Q_init):
+    def _cut_edge(self, selected_edge_idx, expectations, reduced):
         """
-        Cuts the selected edge and returns the reduced QUBO matrix along with a matrix of the same size
-        where the corresponding node values are set to zero.
+        Cuts the selected edge: records the constraint between its nodes and eliminates the
+        first node from the reduced problem in place.
+
+        Several edges selected on the same expectations (see `_select_edges_to_cut`) are cut
+        one after the other. Every component of `constraints` holds exactly one node of the
+        reduced problem, so an edge whose node was already eliminated acts on the node of its
+        component, with the relative sign of the two components' nodes.
 
         Parameters
         ----------
-        selected_edge_idx : int
-            Index of the selected edge to be cut.
+        selected_edge_idx : int or np.ndarray
+            Index (or indices, in selection order) of the selected edges to be cut.
 
         expectations : list
             Expectation values of ZZ interactions for all edges.
 
-        Q_action : np.ndarray
-            Current QUBO matrix tracking active nodes.
-
-        Q_init : np.ndarray
-            Initial QUBO matrix.
-
-        Returns
-        -------
-        tuple
-            Reduced QUBO matrix and an updated QUBO matrix with the selected nodes set to zero.
+        reduced : ReducedIsing
+            The reduced problem, updated in place.
         """
-        edge_list = [(i, j) for i in range(Q_init.shape[0]) for j in range(Q_init.shape[0]) if Q_init[i, j] != 0 and i != j]
-        edge_to_cut = edge_list[selected_edge_idx]
-        edge_to_cut = sorted(edge_to_cut)
-
-        expectation = expectations[selected_edge_idx]
-
-        i, j = edge_to_cut[0], edge_to_cut[1]
-
-        for key in dict(sorted(self.node_assignments.items(), key=lambda item: item[0])):
-            if i >= key:
-                i += 1
-            if j >= key:
-                j += 1
-
-        self.node_assignments[i] = 1
-        self._tree_action(self.tree, expectations, selected_edge_idx, Q_init)
-        new_Q, Q_action = reduce_hamiltonian(Q_init, edge_to_cut[0], edge_to_cut[1], self.node_assignments, int(np.sign(expectation)))
-        if expectation > 0:
-            self.same_list.append((i, j))
-        else:
-            self.diff_list.append((i, j))
-
+        edges = reduced.edges
+        self._tree_action(self.tree, expectations, selected_edge_idx, edges)
+
+        for idx in npo.atleast_1d(selected_edge_idx):
+            expectation = expectations[idx]
+            sign = 1 if expectation > 0 else -1
+            i, j = int(edges.orig_rows[idx]), int(edges.orig_cols[idx])
+            # Positions in the reduced problem of the nodes of the components of i and j
+            positions = {self.constraints.find(int(node))[0]: position for position, node in enumerate(reduced.nodes[:reduced.size])}
+            k, l = sorted((positions[self.constraints.find(i)[0]], positions[self.constraints.find(j)[0]]))
+            self.constraints.union(i, j, sign)
+            if expectation > 0:
+                self.same_list.append((i, j))
+            else:
+                self.diff_list.append((i, j))
 
-        return new_Q, Q_action
+            reduced.eliminate(k, l, self.constraints.relative_sign(int(reduced.nodes[k]), int(reduced.nodes[l])))
 
 
-    def _tree_action(self,tree, expectations,selected_edge_idx,Q_init):
+    def _tree_action(self,tree, expectations,selected_edge_idx,edges):
         """
         Manages tree-based memoization to avoid redundant quantum computations.
 
@@ -460,82 +883,140 @@ class RL_QAOA:
         Args:
             tree (Tree): Tree structure storing previously computed states.
             expectations (list): Expectation values for edges.
-            selected_edge_idx (int): Index of the edge selected for reduction.
-            Q_init (np.ndarray): Initial QUBO matrix before reduction.
+            selected_edge_idx (int or np.ndarray): Index of the edge selected for reduction,
+                or indices of the edges cut together, keyed as the tuple of their edge keys.
+            edges (EdgeIndex): Edge index of the reduced problem before the edge is cut.
         """
-        edge_list = [(i, j) for i in range(Q_init.shape[0]) for j in range(Q_init.shape[0]) if Q_init[i, j] != 0 and i != j]
-        edge_to_cut = edge_list[selected_edge_idx]
-        edge_to_cut = sorted(edge_to_cut)
+        keys = []
+        for idx in npo.atleast_1d(selected_edge_idx):
+            i, j = int(edges.orig_rows[idx]), int(edges.orig_cols[idx])
+            keys.append(edge_key(i, j, 1 if expectations[idx] > 0 else -1))
 
-        expectation = expectations[selected_edge_idx]
+        self.key = keys[0] if npo.ndim(selected_edge_idx) == 0 else tuple(keys)
+        if not tree.has_child(self.key):
+            tree.create(self.key,None)
+        tree.move(self.key)
 
-        i, j = edge_to_cut[0], edge_to_cut[1]
 
-        for key in dict(sorted(self.node_assignments.items(), key=lambda item: item[0])):
-            if i >= key:
-                i += 1
-            if j >= key:
-                j += 1
+    def _request(self, field, compute, Q, idx=None):
+        """
+        Describes a per-problem result needed by an episode, resolved by `_resolve`.
 
-        if expectation > 0:
-            self.key = f'({i},{j})'
-            if tree.has_child(self.key):
-                tree.move(self.key)
+        The key is a canonical hash of the reduced Ising matrix (and of the QAOA parameters
+        used at this step), so the same reduced problem reached through a different
+        elimination order is simulated only once. `tree` and `tree_grad` share the entries.
 
-            else:
-                tree.create(self.key,None)
-                tree.move(self.key)
-        else:
-            self.key = f'({-i},{-j})'
-            if tree.has_child(self.key):
-                tree.move(self.key)
-            else:
-                tree.create(self.key,None)
-                tree.move(self.key)
+        Parameters
+        ----------
+        field : str
+            Name of the result, 'expectations' or 'gradients'.
+
+        compute : callable
+            Computes the result on a cache miss.
+
+        Q : np.ndarray
+            The normalized reduced Ising matrix.
 
+        idx : list, optional
+            Indices of the QAOA parameters used at this reduction step.
 
-    def _action_space(self, Q_action):
+        Returns
+        -------
+        tuple
+            (field, problem key, compute, Q).
         """
-        Maps the edges in the reduced graph to their original positions in the full graph.
+        extra = () if idx is None else (self.param[idx],)
+        return field, problem_key(Q, *extra), compute, Q
 
-        This function is used to track which edges in the reduced graph correspond to the original
-        graph's edges after node elimination. When a node is removed, the edge indices in the
-        reduced graph will shift, and this function helps maintain consistency with the original
-        edge indexing.
+    def _expectations_request(self, Q, index):
+        """
+        Builds the request of the edge expectations of reduction step `index` on Q.
+        """
+        param_idx = [i for i in range(self.p * index * 2, self.p * index * 2 + 2 * self.p)]
+        return self._request('expectations', lambda: self._qaoa_edge_expectations(Q, param_idx), Q, param_idx)
 
-        Example:
-        --------
-        Suppose the original graph has nodes [1, 2, 3, 4, 5] with edges:
-            (1,2), (2,3), (3,4), (4,5)
+    def _resolve(self, request):
+        """
+        Returns the result of a request through the transposition table and the on-disk
+        `store`, computing it on a miss.
+        """
+        field, key, compute, _ = request
+        if self.store is not None:
+            kind = self._model_kind()
+            return self.table.fetch(key, field, lambda: self.store.fetch(kind, key, field, compute))
+        return self.table.fetch(key, field, compute)
 
-        If node 3 is removed, the reduced graph has edges:
-            (1,2), (4,5)
+    def _is_cached(self, request):
+        """
+        Returns whether the result of a request is in the transposition table or the store.
+        """
+        field, key, _, _ = request
+        if self.table.contains(key, field):
+            return True
+        return self.store is not None and self.store.contains(self._model_kind(), key, field)
 
-        The reduced graph will renumber nodes as:
-            (1,2) -> (1,2), (4,5) -> (2,3)
+    def _resolve_batch(self, requests, pool=None):
+        """
+        Resolves the requests of several suspended episodes together.
 
-        This function ensures the correct mapping to the original graph using `Q_action`.
+        Requests for the same problem are merged, and the ones missing from the caches are
+        computed in one call to `_compute_batch` before every result goes through `_resolve`.
 
         Parameters
         ----------
-        Q_action : np.ndarray
-            The original QUBO matrix with node elimination information, used to track active nodes.
+        requests : list of tuple
+            Requests built by `_request`, possibly repeated.
+
+        pool : ThreadPoolExecutor, optional
+            Pool computing the missing results.
 
         Returns
         -------
         list
-            A list of indices indicating which edges in the reduced graph correspond to the original
-            graph structure.
-        """
-        action_space_list = []
-        index = 0  # Tracks the original edge indices
-        for i in range(Q_action.shape[0]):
-            for j in range(i,Q_action.shape[0]):
-                if i != j:  # Avoid self-loops
-                    if Q_action[i, j] != 0:  # Check if the edge exists in the original graph
-                        action_space_list.append(index)  # Store the original edge index
-                    index += 1  # Increment index for original edge mapping
-        return action_space_list
+            The results, in the order of `requests`.
+        """
+        unique = {}
+        for request in requests:
+            unique.setdefault(request[:2], request)
+        missing = [request for request in unique.values() if not self._is_cached(request)]
+        computed = dict(zip((request[:2] for request in missing), self._compute_batch(missing, pool)))
+
+        resolved = {}
+        for name, request in unique.items():
+            if name in computed:
+                request = (*name, lambda value=computed[name]: value, request[3])
+            resolved[name] = self._resolve(request)
+        return [resolved[request[:2]] for request in requests]
+
+    def _compute_batch(self, requests, pool=None):
+        """
+        Computes the results of several requests, on the pool when one is given.
+        """
+        if pool is None:
+            return [request[2]() for request in requests]
+        return list(pool.map(lambda request: request[2](), requests))
+
+    def _await(self, request):
+        """
+        Suspends the running episode until `request` is resolved.
+
+        The episodes of `_run_episodes_batched` share the model, so the state of the
+        suspended episode is saved and restored around the yield, and the tree cursors are
+        left at the roots for the next episode to start from.
+        """
+        state = (self.tree.state, self.tree_grad.state, self.same_list, self.diff_list,
+                 self.constraints, self.beta, self.rng)
+        self.tree.state, self.tree_grad.state = self.tree.root, self.tree_grad.root
+        value = yield request
+        (self.tree.state, self.tree_grad.state, self.same_list, self.diff_list,
+         self.constraints, self.beta, self.rng) = state
+        return value
+
+    def _model_kind(self):
+        """
+        Returns the label separating results of different models in the on-disk store.
+        """
+        return f'qaoa_p{self.p}'
 
     def _qaoa_edge_expectations(self, Q, idx):
         """
@@ -551,23 +1032,25 @@ class RL_QAOA:
 
         Returns
         -------
-        list
-            A list of expectation values for ZZ interactions of the edges in the QUBO matrix.
+        np.ndarray
+            The (n, n) matrix of ZZ expectation values of the final QAOA state.
         """
-        self.qaoa_layer = QAOA_layer(self.p, Q)
+        if self.backend == 'numpy':
+            return StatevectorQAOA(self.p, Q).correlations(self.param[idx])
+        if self.backend == 'analytic':
+            return AnalyticQAOA(self.p, Q).correlations(self.param[idx])
+
+        self.qaoa_layer = layer = QAOA_layer(self.p, Q)
 
-        @qml.qnode(self.qaoa_layer.dev)
+        @qml.qnode(layer.dev)
         def circuit(param):
-            self.qaoa_layer.qaoa_circuit(param)
-            return [qml.expval(qml.PauliZ(i) @ qml.PauliZ(j))
-                    for i in range(Q.shape[0])
-                    for j in range(Q.shape[0])
-                    if Q[i, j] != 0 and i != j]
+            layer.qaoa_circuit(param)
+            return qml.probs(wires=range(Q.shape[0]))
 
-        return circuit(self.param[idx])
+        return zz_correlation_matrix(circuit(self.param[idx]))
 
 
-    def _qaoa_edge_expectations_gradients(self, Q, idx):
+    def _qaoa_edge_expectations_gradients(self, Q, idx, edges):
         """
         Computes the gradients of the expectation values of ZZ interactions for each edge.
 
@@ -576,31 +1059,30 @@ class RL_QAOA:
         Q : np.ndarray
             The QUBO matrix representing the optimization problem.
 
-        idx : int
-            Index for selecting the QAOA parameters.
+        idx : list
+            Indices of the 2 * p QAOA parameters used at this reduction step.
+
+        edges : EdgeIndex
+            Edge index of Q; the Jacobian rows follow its order.
 
         Returns
         -------
-        list
-            A list of gradient values for the expectation values of ZZ interactions.
+        np.ndarray
+            Dense (edges, 2 * p) Jacobian of the edge expectations with respect to `self.param[idx]`.
         """
-        self.qaoa_layer = QAOA_layer(self.p, Q)
-        cal_index = []
+        if self.grad_method == 'adjoint':
+            return np.array(StatevectorQAOA(self.p, Q, (edges.rows, edges.cols)).edge_jacobian(self.param[idx]), requires_grad=True)
+        if self.grad_method == 'analytic':
+            return np.array(AnalyticQAOA(self.p, Q, (edges.rows, edges.cols)).edge_jacobian(self.param[idx]), requires_grad=True)
+
+        self.qaoa_layer = layer = QAOA_layer(self.p, Q)
+        cal_index = [(int(i), int(j)) for i, j in zip(edges.rows, edges.cols)]
 
-        @qml.qnode(self.qaoa_layer.dev)
+        @qml.qnode(layer.dev)
         def circuit(params, cal_list):
-            self.qaoa_layer.qaoa_circuit(params[idx])
+            layer.qaoa_circuit(params[idx])
             return [qml.expval(qml.PauliZ(cal[0]) @ qml.PauliZ(cal[1])) for cal in cal_list]
 
-        # Compute gradients for each valid edge
-        for i in range(Q.shape[0]):
-            for j in range(Q.shape[0]):
-                if Q[i, j] != 0 and i != j:
-                    cal_index.append((i,j))
-
-
-
-
         params = torch.tensor(self.param, requires_grad=True)
         expectation_values = circuit(params,cal_index)
         res = []
@@ -608,7 +1090,7 @@ class RL_QAOA:
             expectation_values[index].backward(retain_graph= True)
             grad_values = params.grad.clone()  # save gradients
             params.grad.zero_()
-            res.append(grad_values)
+            res.append(grad_values[idx])
 
         return np.array(res,requires_grad=True)
 
@@ -616,63 +1098,103 @@ class RL_QAOA:
 
     def _brute_force_optimal(self):
         """
-        Finds the optimal solution using brute force when the graph size is small.
+        Finds the optimal solution exactly once the graph is small.
 
-        Parameters
-        ----------
-        Q : np.ndarray
-            The reduced QUBO matrix.
+        The constraints recorded in `self.constraints` collapse the nodes onto a few free
+        variables, which `exact_minimum` enumerates in Gray-code order with vectorized blocks.
 
         Updates
         -------
-        self.node_assignments : dict
-            Stores the optimal node assignments obtained through brute-force search.
+        self.node_assignments : list
+            Stores the optimal node assignments obtained through exhaustive search.
         """
-        n = self.Q.shape[0]
-        best_value = np.inf
-        res_node = None
-
-        # Find all valid combinations considering the same and different constraints
-        comb_list = get_case(self.same_list, self.diff_list,n)
-
-        for comb in comb_list:
-            value = self._state_energy(np.array(comb), self.Q)
-            if value < best_value:
-                best_value = value
-                res_node = copy.copy(comb)
-        if res_node is None:
-            print(f'case : {self.same_list, self.diff_list,n}')
-            print(f'result : {get_case(self.same_list, self.diff_list,n)}')
+        reps, signs = self.constraints.representatives(self.Q.shape[0])
+        state, _ = exact_minimum(self.Q, reps, signs)
         # Store the optimal assignment
-        self.node_assignments = res_node
+        self.node_assignments = state.tolist()
+
+    def _handoff_costs(self, exact_sizes=(8, 12, 16, 20), step_sizes=(4, 6, 8, 10)):
+        """
+        Returns the labels of the exact solver and of one reduction step in `cost_model`,
+        calibrating them first if they are missing.
+
+        A reduction step is timed as an uncached evaluation of the edge expectations, plus
+        their gradients when the QAOA parameters are trained.
+        """
+        step = f'{self._model_kind()}_{self.backend}' + ('_grad' if self.lr[0] != 0 else '')
+        if not self.cost_model.has('exact'):
+            self.cost_model.calibrate('exact', exact_minimum, exact_sizes)
+        if not self.cost_model.has(step):
+            self.cost_model.calibrate(step, self._handoff_probe, step_sizes)
+        return 'exact', step
+
+    def _handoff_probe(self, Q):
+        """
+        Runs one reduction step on the Ising matrix Q without any cache, for `_handoff_costs`.
+        """
+        reduced = ReducedIsing(Q, normalize=self.NORMALIZE_STEPS)
+        self._expectations_request(reduced.matrix, 0)[2]()
+        if self.lr[0] != 0:
+            self._qaoa_edge_expectations_gradients(reduced.matrix, list(range(2 * self.p)), reduced.edges)
 
-    def _state_energy(self, state, Q):
+    def _hands_off(self, size, cached):
         """
-        Computes the energy of a given state based on the QUBO matrix.
+        Decides whether an episode stops reducing and solves the remaining problem exactly.
+
+        Only problems of at most `max_handoff_size` nodes (by default the largest size both
+        fits were calibrated on) are handed over, and `_episode` always takes the first
+        policy step, so every episode contributes a gradient. The
+        predicted time of enumerating the `size` free nodes now is compared with the one
+        of the remaining reduction steps (the current one is free when its expectations are
+        already in the tree) followed by the enumeration of `n_c` nodes.
 
         Parameters
         ----------
-        state : np.ndarray
-            Binary state vector (e.g. [-1, 1, -1, 1]).
+        size : int
+            Number of nodes of the current reduced problem.
 
-        Q : np.ndarray
-            The QUBO matrix representing the optimization problem.
+        cached : bool
+            Whether the edge expectations of the current step are already known.
 
         Returns
         -------
-        float
-            The computed energy value of the given state.
+        bool
+            True to hand off; always False without a `cost_model`.
+        """
+        if self.cost_model is None:
+            return False
+        exact, step = self._handoff_costs()
+        limit = self.max_handoff_size
+        if limit is None:
+            limit = min(self.cost_model.max_size(exact), self.cost_model.max_size(step))
+        if size > limit:
+            return False
+        remaining = 0.0 if cached else self.cost_model.predict(step, size)
+        rest = size - min(self.edges_per_step, size - self.n_c)
+        while rest > self.n_c:
+            remaining += self.cost_model.predict(step, rest)
+            rest -= min(self.edges_per_step, rest - self.n_c)
+        remaining += self.cost_model.predict(exact, self.n_c)
+        return self.cost_model.predict(exact, size) <= remaining
+
+    def _state_energies(self, states):
         """
-        # Create an identity matrix of the same size
-        identity_matrix = np.eye(Q.shape[0], dtype=bool)
+        Computes the energies of a batch of states of the full problem `self.Q`.
 
-        # Remove diagonal elements from the QUBO matrix to isolate interactions
-        interaction = np.where(identity_matrix, 0, Q)
-        diagonal_elements = np.diag(Q)
+        The diagonal and interaction parts of `self.Q` are split once at construction,
+        so a whole (k, n) block of states is scored with a single matrix product.
 
-        # Compute the energy using the QUBO formulation
-        value = diagonal_elements @ state + state.T @ interaction @ state
-        return value
+        Parameters
+        ----------
+        states : array_like
+            A (k, n) matrix of +1/-1 states, one per row.
+
+        Returns
+        -------
+        np.ndarray
+            The k energies.
+        """
+        return state_energies(np.array(states), self.fields, self.couplings)
 
     def plot_result(self,title = 'RL QAOA'):
         plot_rl_qaoa_results(self.avg_values,self.min_values,self.prob_values,lable=title)
@@ -704,6 +1226,34 @@ class RL_QAA(RL_QAOA):
     learning_rate_init : float, default=0.05
         Initial learning rate for the Adam optimizer.
 
+    cache_size : int, default=4096
+        Maximum number of reduced problems kept in the transposition table.
+
+    store : ExpectationStore or str, optional
+        Persistent on-disk cache (or its directory) consulted behind the transposition table.
+
+    tree_max_bytes : int, optional
+        Byte budget of each of `tree` and `tree_grad`; None keeps every node.
+
+    edges_per_step : int, default=1
+        Maximum number of edges cut per evaluation of the edge expectations.
+
+    cost_model : CostModel, str or bool, optional
+        Enables the adaptive handoff to the exact solver, see `RL_QAOA`.
+
+    max_handoff_size : int, optional
+        Largest problem size handed over to the exact solver, see `RL_QAOA`.
+
+    backend : str, default='pennylane'
+        Simulator used for the annealing pulse. 'pennylane' runs `simulate_time_evolution` in a
+        QNode, 'numpy' uses the split-operator propagator `simulate_statevector` and 'krylov'
+        uses the adaptive-step propagator `simulate_adaptive`.
+
+    krylov_tol : float, default=1e-2
+        Segment tolerance of the 'krylov' backend. The number of propagation segments of every
+        evaluation is collected in `propagation_steps`; `RL_QAOA` logs their mean per epoch
+        and keeps the per-epoch lists in `step_counts`.
+
     Attributes
     ----------
     pulse : PulseSimulationFixed
@@ -721,18 +1271,34 @@ class RL_QAA(RL_QAOA):
     param : np.ndarray
         Parameters for QAA optimization, initialized as [0., 0.].
     """
+    NORMALIZE_STEPS = False
 
-    def __init__(self, qubo, n_c, b_vector, gamma=0.99, learning_rate_init=0.05):
+    def __init__(self, qubo, n_c, b_vector, gamma=0.99, learning_rate_init=0.05, backend='pennylane', krylov_tol=1e-2, cache_size=4096, store=None, tree_max_bytes=None, edges_per_step=1, cost_model=None, max_handoff_size=None):
+        if backend not in ('pennylane', 'numpy', 'krylov'):
+            raise ValueError(f"Unknown backend '{backend}'")
         self.Q = zero_lower_triangle(qubo_to_ising(qubo))
+        self.fields = np.diag(self.Q)
+        self.couplings = self.Q - np.diag(self.fields)
         self.n_c = n_c
         self.b = b_vector
         self.pulse = Pulse_simulation_fixed(qubo)
         self.gamma = gamma
         self.optimzer = AdamOptimizer([np.array([0.,0]), b_vector], learning_rate_init=[0,learning_rate_init])
         self.lr = [0,learning_rate_init]
-        self.tree = Tree('root',None)
-        self.tree_grad = Tree('root',None)
+        self.tree_max_bytes = tree_max_bytes
+        self.tree = Tree('root',None,tree_max_bytes)
+        self.tree_grad = Tree('root',None,tree_max_bytes)
         self.param = np.array([0.,0])
+        self.backend = backend
+        self.krylov_tol = krylov_tol
+        self.table = TranspositionTable(cache_size)
+        self.store = ExpectationStore(store) if isinstance(store, str) else store
+        self.rng = None  # Generator used to sample edges; None uses the global np.random state
+        self.edges_per_step = edges_per_step
+        self.cost_model = as_cost_model(cost_model)
+        self.max_handoff_size = max_handoff_size
+        self.propagation_steps = []  # Segments used by every 'krylov' evaluation of the current epoch
+        self.handoff_size = n_c  # Size at which the last episode handed over to the exact solver
 
     def rqaoa_execute(self):
         """
@@ -749,11 +1315,17 @@ class RL_QAA(RL_QAOA):
             If cal_grad is True, returns gradients, value, and final state.
             Otherwise, returns only the final value.
         """
+        return self._drive(self._episode())
+
+    def _episode(self, actions=None):
+        """
+        Generator running one episode of `rqaoa_execute`, see `RL_QAOA._episode`.
+        """
 
-        Q_init = copy.deepcopy(self.Q)
-        Q_action = copy.deepcopy(self.Q)
+        reduced = ReducedIsing(self.Q, normalize=self.NORMALIZE_STEPS)
         self.same_list = []
         self.diff_list = []
+        self.constraints = ParityUnionFind()
         self.node_assignments = {}
         self.edge_expectations = []
         self.edge_expectations_grad = []
@@ -766,8 +1338,11 @@ class RL_QAA(RL_QAOA):
 
 
 
-        while Q_init.shape[0] > self.n_c:
-            Q_init = zero_lower_triangle(Q_init)
+        while reduced.size > self.n_c:
+            if index > 0 and self._hands_off(reduced.size, self.tree.state.value is not None):
+                break
+            Q_init = reduced.matrix
+            edges = reduced.edges
             if self.b.ndim == 1:
                 self.beta = self.b
             else:
@@ -775,44 +1350,51 @@ class RL_QAA(RL_QAOA):
 
 
             if self.tree.state.value is None:
-                edge_expectations = self._qaoa_edge_expectations(
-                    Q_init
-                )
-                self.tree.state.value = edge_expectations
+                edge_expectations = yield from self._await(self._expectations_request(Q_init, index))
+                edge_expectations = self.tree.set_value(edge_expectations)
             else:
                 edge_expectations = self.tree.state.value
-            selected_edge_idx, policy, edge_res = self._select_edge_to_cut(Q_action, edge_expectations)
+            count = min(self.edges_per_step, reduced.size - self.n_c)
+            if count > 1:
+                selected_edge_idx, policy, edge_res = self._select_edges_to_cut(edges, edge_expectations, count)
+            else:
+                action = None if actions is None or index >= len(actions) else actions[index]
+                selected_edge_idx, policy, edge_res = self._select_edge_to_cut(edges, edge_expectations, action)
 
 
 
             QAOA_diff = np.zeros_like(self.param)
 
-            beta_diff = self._compute_grad_beta(selected_edge_idx, Q_action, policy, edge_res) * self.gamma ** (Q_init.shape[0] - index)
+            beta_diff = self._compute_grad_beta(selected_edge_idx, edges, policy, edge_res) * self.gamma ** (Q_init.shape[0] - index)
             QAOA_diff_list.append(QAOA_diff)
             beta_diff_list.append(beta_diff)
 
-            Q_init, Q_action = self._cut_edge(selected_edge_idx, edge_res, Q_action, Q_init)
+            self._cut_edge(selected_edge_idx, edge_res, reduced)
             index += 1
 
+        self.handoff_size = reduced.size
         self.tree.reset_state()
         self.tree_grad.reset_state()
         # Solve smaller problem using brute force
         self._brute_force_optimal()
-        Value = self._state_energy(np.array(self.node_assignments), self.Q)
+        Value = self._state_energies([self.node_assignments])[0]
 
         # Copy lists to preserve their state
         same_list_copy = copy.deepcopy(self.same_list)
         diff_list_copy = copy.deepcopy(self.diff_list)
 
         if self.n_c != self.Q.shape[0]:
-            QAOA_diff = np.sum(QAOA_diff_list, axis=0)
+            QAOA_diff = np.sum(QAOA_diff_list, axis=0) if QAOA_diff_list else np.zeros_like(self.param)
         else:
             QAOA_diff = None
         if self.n_c != self.Q.shape[0]:
             if self.b.ndim == 1:
-                beta_diff = np.sum(beta_diff_list, axis=0)
+                beta_diff = np.sum(beta_diff_list, axis=0) if beta_diff_list else np.zeros(self.b.shape)
             else:
-                beta_diff = np.stack(beta_diff_list, axis=0)
+                # One row per evaluation; rows of b beyond the last evaluation get no gradient
+                beta_diff = np.zeros(self.b.shape)
+                if beta_diff_list:
+                    beta_diff[:len(beta_diff_list)] = np.stack(beta_diff_list, axis=0)
         else:
             beta_diff = None
 
@@ -834,26 +1416,252 @@ class RL_QAA(RL_QAOA):
 
         Returns
         -------
-        list
-            A list of expectation values for ZZ interactions of the edges in the QUBO matrix.
+        np.ndarray
+            The (n, n) matrix of ZZ expectation values after the annealing pulse.
         """
-        self.pulse = Pulse_simulation_fixed(ising_to_qubo(Q))
+        self.pulse = pulse = Pulse_simulation_fixed(ising_to_qubo(Q))
+        if self.backend == 'numpy':
+            return zz_correlation_matrix(np.abs(pulse.simulate_statevector()) ** 2)
+        if self.backend == 'krylov':
+            state = pulse.simulate_adaptive(self.krylov_tol)
+            self.propagation_steps.append(pulse.num_steps_used)
+            return zz_correlation_matrix(np.abs(state) ** 2)
+
         dev = qml.device("default.qubit", wires=Q.shape[0])
         @qml.qnode(dev)
         def circuit():
-            self.pulse.simulate_time_evolution()
-            return [qml.expval(qml.PauliZ(i) @ qml.PauliZ(j))
-                    for i in range(Q.shape[0])
-                    for j in range(Q.shape[0])
-                    if Q[i, j] != 0 and i != j]
+            pulse.simulate_time_evolution()
+            return qml.probs(wires=range(Q.shape[0]))
+
+        return zz_correlation_matrix(circuit())
 
-        return circuit()
+    def _expectations_request(self, Q, index):
+        """
+        Builds the request of the edge expectations of reduction step `index` on Q.
+        """
+        return self._request('expectations', lambda: self._qaoa_edge_expectations(Q), Q)
+
+    def _compute_batch(self, requests, pool=None):
+        """
+        Computes the results of several requests. With the 'numpy' backend, problems of the
+        same size are evolved together by `pulse_correlations_batch`.
+        """
+        if self.backend != 'numpy':
+            return super()._compute_batch(requests, pool)
+        groups = {}
+        for i, request in enumerate(requests):
+            groups.setdefault(request[3].shape[0], []).append(i)
+        results = [None] * len(requests)
+        for group in groups.values():
+            batch = pulse_correlations_batch([ising_to_qubo(requests[i][3]) for i in group])
+            for i, value in zip(group, batch):
+                results[i] = value
+        return results
+
+    def _model_kind(self):
+        """
+        Returns the label separating results of different models in the on-disk store.
+        The 'pennylane' and 'numpy' backends run the same Trotter evolution and share results.
+        """
+        if self.backend == 'krylov':
+            return f'qaa_krylov_{self.krylov_tol}'
+        return 'qaa'
 
     def plot_result(self,title = 'RL QAA'):
         plot_rl_qaoa_results(self.avg_values,self.min_values,self.prob_values,lable=title)
 
 
 
+class EpisodeAccumulator:
+    """
+    Streaming statistics of the episodes of one epoch.
+
+    Instead of keeping every gradient and state until the end of the epoch, it keeps the
+    running sums of the rewards R, of the gradients g and of R * g, and the best trajectory.
+    The mean-baseline update -sum_e (R_e - mean(R)) g_e / K is recovered at the end as
+    -(sum R g - mean(R) sum g) / K, so memory does not grow with the number of episodes.
+    The update is unchanged by a shift of the rewards, so the sums are taken over the
+    rewards minus the first one added (`shift`); otherwise a large common offset of the
+    rewards would cancel catastrophically. Partial accumulators (e.g. of worker processes)
+    are combined with `merge`.
+
+    Parameters
+    ----------
+    correct_ans : float, optional
+        Optimal value; episodes within 0.01 of it count as successes.
+    """
+
+    def __init__(self, correct_ans=None):
+        self.correct_ans = correct_ans
+        self.count = 0
+        self.successes = 0
+        self.shift = None  # Reward subtracted from every reward in the sums
+        self.value_sum = 0.0
+        self.QAOA_sum = self.QAOA_value_sum = 0.0
+        self.beta_sum = self.beta_value_sum = 0.0
+        self.best = None  # (value, episode index, state, same list, diff list)
+        self.handoffs = {}  # Handoff size -> number of episodes
+
+    def add(self, index, result, handoff=None):
+        """
+        Adds one episode.
+
+        Parameters
+        ----------
+        index : int
+            Episode index; ties of the best reward go to the lowest index.
+
+        result : tuple
+            The return value of `rqaoa_execute`.
+
+        handoff : int, optional
+            Problem size at which the episode switched to the exact solver.
+        """
+        QAOA_diff, beta_diff, value, state, same_list, diff_list = result
+        value = float(value)
+        # Episodes without any reduction step (n_c == n) return None gradients
+        QAOA_diff = npo.zeros_like(self.QAOA_sum) if QAOA_diff is None else npo.asarray(QAOA_diff, dtype=float)
+        beta_diff = npo.zeros_like(self.beta_sum) if beta_diff is None else npo.asarray(beta_diff, dtype=float)
+        if self.shift is None:
+            self.shift = value
+        centred = value - self.shift
+        self.count += 1
+        self.value_sum += centred
+        self.QAOA_sum = self.QAOA_sum + QAOA_diff
+        self.QAOA_value_sum = self.QAOA_value_sum + centred * QAOA_diff
+        self.beta_sum = self.beta_sum + beta_diff
+        self.beta_value_sum = self.beta_value_sum + centred * beta_diff
+        if self.correct_ans is not None and abs(value - self.correct_ans) <= 0.01:
+            self.successes += 1
+        if self.best is None or (value, index) < self.best[:2]:
+            self.best = (value, index, npo.array(state), same_list, diff_list)
+        if handoff is not None:
+            self.handoffs[handoff] = self.handoffs.get(handoff, 0) + 1
+
+    def add_batch(self, indices, QAOA_diffs, beta_diffs, values, states, same_lists, diff_lists, handoff=None):
+        """
+        Adds several episodes given as (episodes, ...) arrays, all handed over at the same
+        size, see `add`.
+        """
+        if len(indices) == 0:
+            return
+        values = npo.asarray(values, dtype=float)
+        if self.shift is None:
+            self.shift = float(values[0])
+        centred = values - self.shift
+        self.count += len(values)
+        self.value_sum += float(npo.sum(centred))
+        self.QAOA_sum = self.QAOA_sum + npo.sum(QAOA_diffs, axis=0)
+        self.QAOA_value_sum = self.QAOA_value_sum + npo.tensordot(centred, QAOA_diffs, axes=1)
+        self.beta_sum = self.beta_sum + npo.sum(beta_diffs, axis=0)
+        self.beta_value_sum = self.beta_value_sum + npo.tensordot(centred, beta_diffs, axes=1)
+        if self.correct_ans is not None:
+            self.successes += int(npo.sum(npo.abs(values - self.correct_ans) <= 0.01))
+        e = int(npo.lexsort((indices, values))[0])
+        if self.best is None or (values[e], indices[e]) < self.best[:2]:
+            self.best = (float(values[e]), int(indices[e]), npo.array(states[e]), same_lists[e], diff_lists[e])
+        if handoff is not None:
+            self.handoffs[handoff] = self.handoffs.get(handoff, 0) + len(values)
+
+    def merge(self, other):
+        """
+        Adds the episodes of another accumulator, moving its sums to the `shift` of this one.
+        """
+        if other.count == 0:
+            return
+        if self.shift is None:
+            self.shift = other.shift
+        offset = other.shift - self.shift
+        self.count += other.count
+        self.successes += other.successes
+        self.value_sum += other.value_sum + offset * other.count
+        self.QAOA_sum = self.QAOA_sum + other.QAOA_sum
+        self.QAOA_value_sum = self.QAOA_value_sum + other.QAOA_value_sum + offset * other.QAOA_sum
+        self.beta_sum = self.beta_sum + other.beta_sum
+        self.beta_value_sum = self.beta_value_sum + other.beta_value_sum + offset * other.beta_sum
+        if other.best is not None and (self.best is None or other.best[:2] < self.best[:2]):
+            self.best = other.best
+        for size, count in other.handoffs.items():
+            self.handoffs[size] = self.handoffs.get(size, 0) + count
+
+    def epoch(self):
+        """
+        Returns the statistics and the parameter updates of the epoch, see `_sampled_epoch`.
+        """
+        mean = self.value_sum / self.count  # Mean of the shifted rewards
+        value, _, state, same_list, diff_list = self.best
+        return {
+            'value': self.shift + mean,
+            'min_value': value,
+            'prob': None if self.correct_ans is None else self.successes / self.count,
+            'best_state': state,
+            'best_same_list': same_list,
+            'best_diff_list': diff_list,
+            'QAOA_diff': -(self.QAOA_value_sum - mean * self.QAOA_sum) / self.count,
+            'beta_diff': -(self.beta_value_sum - mean * self.beta_sum) / self.count,
+            'handoffs': dict(sorted(self.handoffs.items())),
+        }
+
+
+_WORKER_MODEL = None  # Model of a worker process, installed by `_init_worker`
+
+
+def _init_worker(model):
+    """
+    Installs the model of a worker process, once when the process starts.
+
+    Args:
+        model (RL_QAOA): The `_worker_copy` of the model.
+    """
+    global _WORKER_MODEL
+    _WORKER_MODEL = model
+
+
+def _rollout_episodes(param, b, clock, delta, indices, seeds, accumulator):
+    """
+    Runs one episode per seed on the model of the worker process.
+
+    Args:
+        param (np.ndarray): Current QAOA parameters. The caches of the worker are cleared
+            when they changed, since the cached values depend on them.
+        b (np.ndarray): Current policy parameters.
+        clock (int): Visit clock of the tree of the main process, so the merged nodes are
+            stamped as recently visited.
+        delta (tuple): The trees of the nodes computed by all workers in the previous epoch,
+            merged into the trees of the worker, or None.
+        indices (list): Episode indices.
+        seeds (list): One np.random.SeedSequence per episode.
+        accumulator (EpisodeAccumulator): Empty accumulator receiving the episodes.
+
+    Returns:
+        tuple: The filled accumulator, the trees of the nodes computed by these episodes
+        (see `Tree.extract`) and the `propagation_steps` of the worker's evaluations.
+    """
+    model = _WORKER_MODEL
+    if not npo.array_equal(model.param, param):
+        model.tree = Tree('root',None,model.tree_max_bytes)
+        model.tree_grad = Tree('root',None,model.tree_max_bytes)
+        model.table.clear()
+    model.param, model.b = param, b
+    trees = (model.tree, model.tree_grad)
+    for tree, new in zip(trees, delta or ()):
+        tree.merge(new)
+    for tree in trees:
+        tree.clock = max(tree.clock, clock)
+    # Nodes held before the episodes, with whether they had a value
+    known = {node: node.value is not None for tree in trees for node in tree.nodes()}
+    model.propagation_steps = []
+    for index, seed in zip(indices, seeds):
+        model.rng = npo.random.default_rng(seed)
+        accumulator.add(index, model.rqaoa_execute(), model.handoff_size)
+
+    def is_new(node):
+        return node not in known or (not known[node] and node.value is not None)
+
+    computed = [tree.extract(is_new) for tree in trees]
+    return accumulator, computed[0], computed[1], model.propagation_steps
+
+
 def generate_upper_triangular_qubo(size, node_weight_range=(-3, 3), edge_weight_range=(-3, 3), integer=True, seed=None):
     """
     Generates an upper-triangular QUBO (Quadratic Unconstrained Binary Optimization) matrix.
@@ -1119,118 +1927,6 @@ class QAOA_layer:
 
 
 
-def add_zero_row_col(matrix, m):
-    """
-    Adds a new row and column filled with zeros at the specified position
-    in an n x n matrix, resulting in an (n+1) x (n+1) matrix.
-
-    Args:
-        matrix (np.array): The original n x n matrix.
-        m (int): The index (0-based) where the new row and column will be inserted.
-
-    Returns:
-        np.array: The expanded (n+1) x (n+1) matrix with the new row and column filled with zeros.
-    """
-    n = matrix.shape[0]  # Get the size of the original matrix
-
-    # Create a new (n+1)x(n+1) matrix initialized with zeros
-    new_matrix = np.zeros((n + 1, n + 1))
-
-    # Copy the top-left submatrix (before row m and column m)
-    new_matrix[:m, :m] = matrix[:m, :m]
-
-    # Copy the top-right submatrix (after column m)
-    new_matrix[:m, m+1:] = matrix[:m, m:]
-
-    # Copy the bottom-left submatrix (after row m)
-    new_matrix[m+1:, :m] = matrix[m:, :m]
-
-    # Copy the bottom-right submatrix (after row m and column m)
-    new_matrix[m+1:, m+1:] = matrix[m:, m:]
-
-    # The new row (index m) and column (index m) remain zeros by default
-
-    return new_matrix
-
-
-
-
-
-
-def reduce_hamiltonian(J, k, l, node_assignments, sign):
-    """
-    Reduces the given Hamiltonian matrix by applying the constraint Z_k = sign * Z_l.
-
-    Args:
-        J (np.array): The initial Hamiltonian matrix (including diagonal terms).
-        k (int): Index of the variable to be removed.
-        l (int): Index of the variable to be replaced.
-        node_assignments (dict): Dictionary mapping node indices to assignments.
-        sign (int): Relationship (1 if identical, -1 if opposite).
-
-    Returns:
-        tuple:
-            - np.array: The reduced Hamiltonian matrix with the k-th variable removed.
-            - np.array: An expanded version of the reduced matrix with extra rows and columns added back.
-    """
-    # Update interactions: J[i, l] = J[i, l] + sign * J[i, k]
-    J_res = copy.deepcopy(J)
-
-    for i in range(J.shape[0]):
-        if i != k and i != l:
-            J_res[i, l] += sign * J_res[i, k]  # Update row
-            J_res[l, i] += sign * J_res[k, i]  # Update column
-
-    # Update diagonal elements (self-interaction term)
-    J_res[l, l] = sign * J_res[k, k] + J_res[l, l]
-
-    # Zero out lower triangular elements to maintain upper triangular form
-    J_res = zero_lower_triangle(J_res)
-
-    # Sort keys for correct row/column addition
-    key_list = sorted(node_assignments.keys())
-
-    # Set the removed row and column to zero before deletion
-    J_res[:, k] = 0
-    J_res[k, :] = 0
-
-    # Remove the k-th row and column
-    J_res = np.delete(J_res, k, axis=0)
-    J_res = np.delete(J_res, k, axis=1)
-
-    # Create a copy for expansion
-    R = copy.deepcopy(J_res)
-
-    # Add back zero rows and columns at specified indices
-    for key in key_list:
-        R = add_zero_row_col(R, key)
-    return J_res, R
-
-def add_zero_row_col(matrix, m):
-    """
-    Adds a new row and column filled with zeros at the specified position
-    in an n x n matrix, resulting in an (n+1) x (n+1) matrix.
-
-    Args:
-        matrix (np.array): The original n x n matrix.
-        m (int): The index (0-based) where the new row and column will be inserted.
-
-    Returns:
-        np.array: The expanded (n+1) x (n+1) matrix with the new row and column filled with zeros.
-    """
-    n = matrix.shape[0]
-
-    # Create a new (n+1)x(n+1) matrix initialized with zeros
-    new_matrix = np.zeros((n + 1, n + 1))
-
-    # Copy the existing elements to the new matrix
-    new_matrix[:m, :m] = matrix[:m, :m]      # Top-left block
-    new_matrix[:m, m+1:] = matrix[:m, m:]    # Top-right block
-    new_matrix[m+1:, :m] = matrix[m:, :m]    # Bottom-left block
-    new_matrix[m+1:, m+1:] = matrix[m:, m:]  # Bottom-right block
-
-    return new_matrix
-
 def signed_softmax_rewards(rewards, beta=15.0):
     """
     Apply softmax transformation to absolute values of rewards
@@ -1258,61 +1954,6 @@ def signed_softmax_rewards(rewards, beta=15.0):
 
 
 
-class Edge:
-    """
-    Represents an edge in the graph connecting nodes with a "same" or "different" condition.
-
-    Attributes:
-        value (int): The target node index.
-        same (bool): True if nodes must have the same value, False if they must have different values.
-    """
-    def __init__(self, edge_type, value):
-        self.value = value
-        self.same = edge_type == "same"  # True if 'same', False if 'diff'
-
-def dfs(node, node_number, edge_list, tmp_list, result_list):
-    """
-    Depth-First Search (DFS) function to explore valid assignments of values to nodes
-    based on the given same/different constraints.
-
-    Args:
-        node (int): Current node index being processed.
-        node_number (int): Total number of nodes.
-        edge_list (dict): Adjacency list representation of constraints.
-        tmp_list (list): Temporary list storing current node assignments.
-        result_list (list): List to store valid assignment combinations.
-
-    Returns:
-        None
-    """
-    if node == node_number:
-        result_list.append(copy.deepcopy(tmp_list))
-        return
-
-    if len(edge_list[node]) == 0:
-        # Assign possible values (-1 or 1) and continue exploring
-        tmp_list[node] = 1
-        dfs(node + 1, node_number, edge_list, tmp_list, result_list)
-        tmp_list[node] = -1
-        dfs(node + 1, node_number, edge_list, tmp_list, result_list)
-        return
-
-    tmp_list[node] = 0  # Reset node value
-    for e in edge_list[node]:
-        if e.same:
-            res = tmp_list[e.value]
-        else:
-            res = -1 * tmp_list[e.value]
-
-        # Conflict check
-        if tmp_list[node] != 0 and tmp_list[node] != res:
-            return
-
-        tmp_list[node] = res
-
-    dfs(node + 1, node_number, edge_list, tmp_list, result_list)
-    return
-
 def get_case(same_list, diff_list, node_number):
     """
     Generates all possible assignments of values to nodes that satisfy given same/different constraints.
@@ -1325,30 +1966,9 @@ def get_case(same_list, diff_list, node_number):
     Returns:
         list: A list of valid node value assignments satisfying all constraints.
     """
-    edge_list = {i: [] for i in range(node_number)}
-
-    # Create "same" edges (bi-directional relationships)
-    for e in same_list:
-        if e[0] < e[1]:
-            edge_list[e[1]].append(Edge('same', e[0]))
-        else:
-            edge_list[e[0]].append(Edge('same', e[1]))
-
-    # Create "different" edges (bi-directional relationships)
-    for e in diff_list:
-        if e[0] < e[1]:
-            edge_list[e[1]].append(Edge('diff', e[0]))
-        else:
-            edge_list[e[0]].append(Edge('diff', e[1]))
-
-    # Initialize temporary storage and results list
-    tmp_list = [0] * node_number
-    result_list = []
-
-    # Start DFS traversal
-    dfs(0, node_number, edge_list, tmp_list, result_list)
-
-    return result_list
+    reps, signs = collapse_constraints(same_list, diff_list, node_number)
+    free = spin_table(int(np.max(reps)) + 1) if node_number else np.zeros((1, 0), dtype=int)
+    return (free[:, reps] * signs).tolist()
 
 
 
@@ -0,0 +1,495 @@
+import copy
+import numpy as np
+from codes.data_process import ReducedIsing,edge_key
+from codes.exact_solver import collapse_constraints,exact_minimum
+
+
+class CachedStep:
+    """
+    One node of the memoized `Tree` compiled for vectorized rollouts.
+
+    Holds the edge arrays of the reduced problem at the node, the expectations stored in the
+    node, and the tree keys of the child reached through every edge. Leaf steps (at the
+    `n_c` handoff) instead hold the exact solution of the constrained problem.
+
+    Parameters
+    ----------
+    node : TreeNode
+        The tree node.
+
+    reduced : ReducedIsing or None
+        The reduced problem at the node; None for a leaf.
+
+    same_list, diff_list : tuple
+        Constraints recorded on the path from the root.
+    """
+    __slots__ = ('node', 'reduced', 'same_list', 'diff_list', 'flat', 'abs_expectations',
+                 'keys', 'children', 'value', 'state')
+
+    def __init__(self, node, reduced, same_list, diff_list):
+        self.node = node
+        self.reduced = reduced
+        self.same_list = same_list
+        self.diff_list = diff_list
+        self.children = {}
+        self.value = None
+        self.state = None
+        if reduced is not None:
+            edges = reduced.edges
+            expectations = np.asarray(node.value)[edges.rows, edges.cols]
+            self.flat = edges.flat
+            self.abs_expectations = np.abs(expectations).astype(float)
+            self.keys = edge_key(edges.orig_rows, edges.orig_cols, np.where(expectations > 0, 1, -1))
+
+
+class CachedRollout:
+    """
+    Runs the episodes of an epoch together over the cached part of a model's `tree`.
+
+    When the QAOA parameters are frozen (lr[0] == 0, e.g. `RL_QAA`) the tree is kept across
+    epochs, and most steps only read cached expectations and sample an edge. Here the
+    episodes advance level by level: the policies of the distinct nodes reached at a level are
+    stacked into one padded matrix, every episode samples its edge by Gumbel-max, and the beta
+    scores are accumulated into one (episodes, ...) array. The compiled nodes and the exact
+    leaf solutions are memoized across epochs. Episodes reaching a node that is not cached
+    escape, and are finished by the model with their sampled prefix.
+
+    Parameters
+    ----------
+    model : RL_QAOA
+        The model whose `tree`, `b`, `gamma` and `n_c` are used.
+
+    normalize : bool
+        Whether the reduced problems are normalized, as in the model's episodes.
+    """
+
+    def __init__(self, model, normalize):
+        self.model = model
+        self.normalize = normalize
+        self.n = model.Q.shape[0]
+        self.depth = max(self.n - model.n_c, 0)
+        self.steps = {}
+        self.tree = None
+        self.evicted = None
+
+    def _sync(self):
+        """
+        Drops the compiled steps when the model's tree was replaced or evicted nodes.
+        """
+        tree = self.model.tree
+        if tree is not self.tree or tree.evicted != self.evicted:
+            self.steps = {}
+            self.tree, self.evicted = tree, tree.evicted
+
+    def root(self):
+        """
+        Returns the compiled root step, or None if the root is not cached.
+        """
+        self._sync()
+        node = self.tree.root
+        if node in self.steps:
+            return self.steps[node]
+        if self.depth == 0:
+            step = self._leaf(CachedStep(node, None, (), ()))
+        elif node.value is None:
+            return None
+        else:
+            step = CachedStep(node, ReducedIsing(self.model.Q, normalize=self.normalize), (), ())
+        self.steps[node] = step
+        return step
+
+    def child(self, step, action, depth):
+        """
+        Returns the compiled step reached from `step` through edge `action`, or None if it is
+        not cached.
+
+        Parameters
+        ----------
+        step : CachedStep
+            The parent step, at level `depth`.
+
+        action : int
+            Index of the cut edge.
+
+        depth : int
+            Level of the parent step.
+        """
+        if action in step.children:
+            return step.children[action]
+        children = step.node.children
+        node = None if children is None else children.get(int(step.keys[action]))
+        if node is None:
+            return None
+        if node in self.steps:
+            step.children[action] = self.steps[node]
+            return self.steps[node]
+        if node.value is None and depth + 1 < self.depth:
+            return None
+        return self._compile(step, action, node, depth)
+
+    def _compile(self, step, action, node, depth, reduced=None):
+        """
+        Compiles the cached child `node` reached from `step` through edge `action`.
+        """
+        edges = step.reduced.edges
+        i, j = int(edges.orig_rows[action]), int(edges.orig_cols[action])
+        if step.keys[action] % 2 == 0:
+            same_list, diff_list = step.same_list + ((i, j),), step.diff_list
+        else:
+            same_list, diff_list = step.same_list, step.diff_list + ((i, j),)
+        if depth + 1 == self.depth:
+            child = self._leaf(CachedStep(node, None, same_list, diff_list))
+        else:
+            if reduced is None:
+                reduced = self._reduce(step, action)
+            child = CachedStep(node, reduced, same_list, diff_list)
+        self.steps[node] = step.children[action] = child
+        return child
+
+    def _reduce(self, step, action):
+        """
+        Returns a copy of the reduced problem of `step` with edge `action` cut.
+        """
+        edges = step.reduced.edges
+        reduced = copy.deepcopy(step.reduced)
+        reduced.eliminate(edges.rows[action], edges.cols[action], 1 if step.keys[action] % 2 == 0 else -1)
+        return reduced
+
+    def _leaf(self, step):
+        """
+        Solves the constrained problem of a leaf step exactly, as `_brute_force_optimal` does.
+        """
+        reps, signs = collapse_constraints(step.same_list, step.diff_list, self.n)
+        state, _ = exact_minimum(self.model.Q, reps, signs)
+        step.state = state
+        step.value = float(self.model._state_energies([state])[0])
+        return step
+
+    def beta(self, depth):
+        """
+        Returns the beta vector used at level `depth`.
+        """
+        b = self.model.b
+        return b if b.ndim == 1 else b[depth]
+
+    def discount(self, depth):
+        """
+        Returns the discount applied to the scores of level `depth`, as in `rqaoa_execute`.
+        """
+        return self.model.gamma ** (self.n - 2 * depth)
+
+    def interactions(self, step, depth):
+        """
+        Returns the logits |<ZZ>| * beta of the edges of `step` at level `depth`.
+        """
+        return step.abs_expectations * np.asarray(self.beta(depth))[step.flat]
+
+    def policy(self, step, depth):
+        """
+        Returns the softmax policy over the edges of `step` at level `depth`.
+        """
+        interactions = self.interactions(step, depth)
+        exp_interactions = np.exp(interactions - np.max(interactions))
+        return exp_interactions / np.sum(exp_interactions)
+
+    def _store(self, node, value):
+        """
+        Stores the expectations of a node through the tree's cursor.
+        """
+        state, self.tree.state = self.tree.state, node
+        self.tree.set_value(value)
+        self.tree.state = state
+
+    def expand(self, max_nodes, pool=None):
+        """
+        Compiles the whole tree reachable under the policy, evaluating the missing nodes.
+
+        Every edge of every node is followed, so the nodes are created in the tree and their
+        expectations are resolved by the model (one `_resolve_batch` per parent). The walk stops
+        as soon as more than `max_nodes` nodes are reached.
+
+        Parameters
+        ----------
+        max_nodes : int
+            Node budget.
+
+        pool : ThreadPoolExecutor, optional
+            Pool evaluating the missing nodes.
+
+        Returns
+        -------
+        CachedStep or None
+            The compiled root, or None if the reachable tree exceeds the budget.
+        """
+        root = self.root()
+        if root is None:
+            node = self.tree.root
+            reduced = ReducedIsing(self.model.Q, normalize=self.normalize)
+            self._store(node, self.model._resolve(self.model._expectations_request(reduced.matrix, 0)))
+            root = self.steps[node] = CachedStep(node, reduced, (), ())
+
+        count, stack = 1, [(root, 0)]
+        while stack:
+            step, depth = stack.pop()
+            if step.reduced is None:
+                continue
+            count += len(step.keys)
+            if count > max_nodes:
+                return None
+            pending = []
+            for action in range(len(step.keys)):
+                child = self.child(step, action, depth)
+                if child is None and depth + 1 == self.depth:
+                    self._compile(step, action, self._attach(step, action), depth)
+                elif child is None:
+                    node = self._attach(step, action)
+                    reduced = self._reduce(step, action)
+                    pending.append((action, node, reduced))
+                else:
+                    stack.append((child, depth + 1))
+            if pending:
+                requests = [self.model._expectations_request(reduced.matrix, depth + 1) for _, _, reduced in pending]
+                for (action, node, reduced), value in zip(pending, self.model._resolve_batch(requests, pool)):
+                    self._store(node, value)
+                    stack.append((self._compile(step, action, node, depth, reduced), depth + 1))
+        return root
+
+    def count(self, max_nodes):
+        """
+        Counts the nodes of the tree reachable under the policy, without evaluating any.
+
+        Cutting an edge contracts its two nodes whatever the sign of its expectation, so the
+        edges of every node follow from the couplings of Q alone. The count recurses over
+        the distinct contracted graphs, memoized since different elimination orders reach
+        the same graph. A coupling cancelled exactly by a contraction still counts as an
+        edge, so the count is an upper bound.
+
+        Parameters
+        ----------
+        max_nodes : int
+            Node budget; the count stops as soon as it is exceeded.
+
+        Returns
+        -------
+        int
+            The number of reachable nodes, or max_nodes + 1 if it exceeds the budget.
+        """
+        Q = np.asarray(self.model.Q)
+        rows, cols = np.nonzero(np.triu((Q != 0) | (Q.T != 0), 1))
+        memo = {}
+
+        def contract(edges, i, j):
+            # Merges node j into node i; edges are labelled by their sorted end nodes
+            merged = set()
+            for a, b in edges:
+                a, b = (i if a == j else a), (i if b == j else b)
+                if a != b:
+                    merged.add((min(a, b), max(a, b)))
+            return frozenset(merged)
+
+        def nodes(edges, depth):
+            if depth == self.depth:
+                return 1
+            if (edges, depth) in memo:
+                return memo[edges, depth]
+            total = 1
+            for i, j in edges:
+                total += nodes(contract(edges, i, j), depth + 1)
+                if total > max_nodes:
+                    total = max_nodes + 1
+                    break
+            memo[edges, depth] = total
+            return total
+
+        return nodes(frozenset(zip(rows.tolist(), cols.tolist())), 0)
+
+    def _attach(self, step, action):
+        """
+        Returns the tree node reached from `step` through edge `action`, creating it if missing.
+        """
+        key = int(step.keys[action])
+        state, self.tree.state = self.tree.state, step.node
+        if not self.tree.has_child(key):
+            self.tree.create(key, None)
+        self.tree.state = state
+        return step.node.children[key]
+
+    def exact(self, max_nodes, correct_ans=None, pool=None):
+        """
+        Evaluates the policy exactly by dynamic programming over the reachable tree.
+
+        With pi the policy of a node and s_a = gamma_d * (onehot_a - pi) * |<ZZ>| the
+        discounted beta score of edge a, one post-order pass computes
+
+            V(x) = sum_a pi_a V(child_a),
+            G(x) = sum_a pi_a (V(child_a) s_a + G(child_a)),
+
+        from the memoized leaf rewards, so V(root) is the expected reward and G(root) the
+        expectation of the beta score weighted by the reward, which is also its covariance
+        with the reward as the scores have zero mean. The size of the reachable tree is
+        checked with `count` before any node is evaluated, and the tree byte budget is
+        lifted while the tree is expanded.
+
+        Parameters
+        ----------
+        max_nodes : int
+            Node budget; larger reachable trees are not evaluated.
+
+        correct_ans : float, optional
+            Optimal value; the probability of reaching it within 0.01 is also computed.
+
+        pool : ThreadPoolExecutor, optional
+            Pool evaluating the missing nodes.
+
+        Returns
+        -------
+        dict or None
+            'value' the expected reward, 'prob' the success probability (None without
+            `correct_ans`), 'beta_grad' G(root) shaped like b, and 'best' the leaf step with
+            the lowest reward. None if the reachable tree exceeds `max_nodes`.
+        """
+        self._sync()
+        if self.count(max_nodes) > max_nodes:
+            return None
+        budget, self.tree.max_bytes = self.tree.max_bytes, None
+        try:
+            root = self.expand(max_nodes, pool)
+        finally:
+            self.tree.max_bytes = budget
+        if root is None:
+            self.tree._check_budget()
+            return None
+        value, prob, grad, best = self._evaluate(root, 0, correct_ans)
+        self.tree._check_budget()
+        return {'value': value, 'prob': prob, 'beta_grad': grad, 'best': best}
+
+    def _evaluate(self, step, depth, correct_ans):
+        """
+        Returns (V, success probability, G, best leaf) of the subtree of a compiled step.
+        """
+        b = np.asarray(self.model.b)
+        if step.reduced is None:
+            prob = None if correct_ans is None else float(abs(step.value - correct_ans) <= 0.01)
+            return step.value, prob, np.zeros(b.shape), step
+
+        policy = self.policy(step, depth)
+        values, probs, grads, best = np.zeros(len(policy)), np.zeros(len(policy)), [], None
+        for action in range(len(policy)):
+            values[action], probs[action], grad, leaf = self._evaluate(step.children[action], depth + 1, correct_ans)
+            grads.append(grad)
+            if best is None or leaf.value < best.value:
+                best = leaf
+
+        grad = np.tensordot(policy, np.stack(grads), axes=1)
+        # sum_a pi_a V_a (onehot_a - pi) = pi * V - pi * (pi . V), per edge
+        weighted = policy * values
+        score = (weighted - policy * np.sum(weighted)) * step.abs_expectations * self.discount(depth)
+        if b.ndim == 1:
+            np.add.at(grad, step.flat, score)
+        else:
+            np.add.at(grad[depth], step.flat, score)
+        prob = None if correct_ans is None else float(policy @ probs)
+        return float(policy @ values), prob, grad, best
+
+    def run(self, episodes, rng=None):
+        """
+        Rolls out `episodes` episodes over the cached tree.
+
+        Parameters
+        ----------
+        episodes : int
+            Number of episodes.
+
+        rng : np.random.Generator, optional
+            Source of the Gumbel noise; None uses the global np.random state.
+
+        Returns
+        -------
+        dict
+            'values' (episodes,) rewards, 'states' (episodes, n) final states and 'beta_diffs'
+            the summed beta scores, (episodes, len(b)) or (episodes, depth, len(b[0])) for a
+            per-step b, as `rqaoa_execute` returns them. 'same_lists' and 'diff_lists' hold
+            the recorded constraints and 'actions' the (episodes, depth) sampled edge indices.
+            'escaped' lists the episodes that left the cached tree and 'prefixes' the edges
+            they cut before leaving it; their entries in the other fields are unset.
+        """
+        rng = np.random if rng is None else rng
+        b = self.model.b
+        if b.ndim == 1:
+            beta_diffs = np.zeros((episodes, b.shape[0]))
+        else:
+            beta_diffs = np.zeros((episodes, self.depth, b.shape[-1]))
+        actions = np.zeros((episodes, self.depth), dtype=int)
+
+        root = self.root()
+        current = np.empty(episodes, dtype=object)
+        current[:] = [root] * episodes
+        active = np.full(episodes, root is not None)
+        escaped_at = np.zeros(episodes, dtype=int)
+
+        for depth in range(self.depth):
+            index = np.flatnonzero(active)
+            if len(index) == 0:
+                break
+            # Stack the policies of the distinct nodes reached at this level
+            steps, group = [], np.empty(len(index), dtype=int)
+            position = {}
+            for e, step in enumerate(current[index]):
+                if id(step) not in position:
+                    position[id(step)] = len(steps)
+                    steps.append(step)
+                group[e] = position[id(step)]
+            width = max(len(step.flat) for step in steps)
+            logits = np.full((len(steps), width), -np.inf)
+            policy = np.zeros((len(steps), width))
+            scores = np.zeros((len(steps), width))
+            flat = np.zeros((len(steps), width), dtype=int)
+            for s, step in enumerate(steps):
+                m = len(step.flat)
+                logits[s, :m] = self.interactions(step, depth)
+                policy[s, :m] = self.policy(step, depth)
+                scores[s, :m] = step.abs_expectations
+                flat[s, :m] = step.flat
+                step.node.last_visit = self.tree.clock
+
+            # Gumbel-max sampling of one edge per episode
+            chosen = np.argmax(logits[group] + rng.gumbel(size=(len(index), width)), axis=1)
+            actions[index, depth] = chosen
+
+            # Score (onehot - policy) * |<ZZ>|, scattered onto the beta entries of the edges
+            weights = -policy[group]
+            weights[np.arange(len(index)), chosen] += 1
+            weights *= scores[group] * self.discount(depth)
+            level = np.zeros((len(index), beta_diffs.shape[-1]))
+            np.add.at(level, (np.arange(len(index))[:, None], flat[group]), weights)
+            if b.ndim == 1:
+                beta_diffs[index] += level
+            else:
+                beta_diffs[index, depth] = level
+
+            for e, (s, action) in enumerate(zip(group, chosen)):
+                child = self.child(steps[s], int(action), depth)
+                if child is None:
+                    active[index[e]] = False
+                    escaped_at[index[e]] = depth + 1
+                current[index[e]] = child
+
+        finished = np.flatnonzero(active)
+        values = np.zeros(episodes)
+        states = np.zeros((episodes, self.n), dtype=int)
+        same_lists, diff_lists = [None] * episodes, [None] * episodes
+        for e in finished:
+            leaf = current[e]
+            values[e], states[e] = leaf.value, leaf.state
+            same_lists[e], diff_lists[e] = list(leaf.same_list), list(leaf.diff_list)
+        escaped = np.flatnonzero(~active)
+        return {
+            'values': values,
+            'states': states,
+            'beta_diffs': beta_diffs,
+            'same_lists': same_lists,
+            'diff_lists': diff_lists,
+            'escaped': escaped,
+            'actions': actions,
+            'prefixes': [actions[e, :escaped_at[e]].tolist() for e in escaped],
+        }
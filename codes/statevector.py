@@ -0,0 +1,443 @@
+import itertools
+import math
+import numpy as np
+import scipy.sparse as sparse
+from scipy.sparse.linalg import expm_multiply
+
+
+def spin_table(n):
+    """
+    Builds the table of Z eigenvalues for every computational basis state.
+
+    The basis ordering follows PennyLane, i.e. wire 0 is the most significant bit.
+
+    Args:
+        n (int): Number of qubits.
+
+    Returns:
+        np.ndarray: A (2**n, n) array whose entry [x, i] is +1 if qubit i is |0> in state x, else -1.
+    """
+    index = np.arange(2 ** n)[:, None]
+    shifts = np.arange(n - 1, -1, -1)[None, :]
+    return 1 - 2 * ((index >> shifts) & 1).astype(np.int8)
+
+
+def state_energies(states, fields, couplings):
+    """
+    Evaluates the Ising cost sum_i h_i z_i + z^T J z of a batch of +1/-1 states.
+
+    Args:
+        states (np.ndarray): A (k, n) matrix of +1/-1 states, one per row.
+        fields (np.ndarray): Local fields h, length n.
+        couplings (np.ndarray): Coupling matrix J with a zero diagonal, shape (n, n).
+
+    Returns:
+        np.ndarray: The k energies.
+    """
+    states = np.asarray(states, dtype=float)
+    return states @ fields + np.einsum("ki,ki->k", states @ couplings, states)
+
+
+def ising_energies(Q, spins=None):
+    """
+    Evaluates the Ising cost sum_i Q_ii Z_i + sum_{i != j} Q_ij Z_i Z_j on every basis state.
+
+    Args:
+        Q (np.ndarray): Ising matrix (diagonal: local fields, off-diagonal: couplings).
+        spins (np.ndarray, optional): Precomputed output of `spin_table`.
+
+    Returns:
+        np.ndarray: Diagonal of the cost Hamiltonian, length 2**n.
+    """
+    Q = np.asarray(Q, dtype=float)
+    if spins is None:
+        spins = spin_table(Q.shape[0])
+    return state_energies(spins, np.diag(Q), Q - np.diag(np.diag(Q)))
+
+
+def zz_correlation_matrix(probs, spins=None):
+    """
+    Computes the full matrix of <Z_i Z_j> from a probability vector in one pass.
+
+    Uses <Z_i Z_j> = sum_x p(x) s_i(x) s_j(x), i.e. a single product S^T diag(p) S
+    with the spin table S, instead of one expectation reduction per edge.
+
+    Args:
+        probs (np.ndarray): Basis state probabilities, shape (2**n,) or (batch, 2**n).
+        spins (np.ndarray, optional): Precomputed output of `spin_table`.
+
+    Returns:
+        np.ndarray: Symmetric (n, n) correlation matrix with ones on the diagonal,
+        or a (batch, n, n) stack of them.
+    """
+    probs = np.asarray(probs, dtype=float)
+    if spins is None:
+        spins = spin_table(int(np.log2(probs.shape[-1])))
+    return spins.T @ (probs[..., None] * spins)
+
+
+def apply_rx_layer(state, beta, n):
+    """
+    Applies RX(2 * beta) to every qubit of one or several statevectors.
+
+    Args:
+        state (np.ndarray): Statevector(s) of shape (..., 2**n).
+        beta (float): Mixer angle.
+        n (int): Number of qubits.
+
+    Returns:
+        np.ndarray: The rotated statevector(s), same shape as the input.
+    """
+    shape = state.shape
+    c, s = np.cos(beta), -1j * np.sin(beta)
+    for q in range(n):
+        psi = state.reshape(-1, 2 ** q, 2, 2 ** (n - q - 1))
+        state = np.stack(
+            (c * psi[:, :, 0] + s * psi[:, :, 1], s * psi[:, :, 0] + c * psi[:, :, 1]),
+            axis=2,
+        )
+    return state.reshape(shape)
+
+
+def apply_qubit_gates(state, gates, n):
+    """
+    Applies one 2x2 gate to every qubit of one or several statevectors.
+
+    Args:
+        state (np.ndarray): Statevector(s) of shape (2**n,) or (batch, 2**n).
+        gates (np.ndarray): Gates of shape (n, 2, 2), or (batch, n, 2, 2) for one set per statevector.
+        n (int): Number of qubits.
+
+    Returns:
+        np.ndarray: The updated statevector(s), same shape as the input.
+    """
+    shape = state.shape
+    state = state.reshape(-1, 2 ** n)
+    gates = np.broadcast_to(gates, (state.shape[0], n, 2, 2))
+    for q in range(n):
+        psi = state.reshape(state.shape[0], 2 ** q, 2, 2 ** (n - q - 1))
+        g = gates[:, q, :, :, None, None]
+        state = np.stack(
+            (g[:, 0, 0] * psi[:, :, 0] + g[:, 0, 1] * psi[:, :, 1],
+             g[:, 1, 0] * psi[:, :, 0] + g[:, 1, 1] * psi[:, :, 1]),
+            axis=2,
+        )
+    return state.reshape(shape)
+
+
+def apply_x_sum(state, n):
+    """
+    Applies the mixer generator sum_q X_q to a statevector.
+
+    Args:
+        state (np.ndarray): Statevector of length 2**n.
+        n (int): Number of qubits.
+
+    Returns:
+        np.ndarray: The vector (sum_q X_q) |state>.
+    """
+    result = np.zeros_like(state)
+    for q in range(n):
+        result += state.reshape(2 ** q, 2, 2 ** (n - q - 1))[:, ::-1, :].reshape(-1)
+    return result
+
+
+class StatevectorQAOA:
+    """
+    A NumPy statevector implementation of `QAOA_layer`.
+
+    The cost layer is applied as one precomputed diagonal phase vector and the mixer
+    as per-qubit RX rotations on a reshaped statevector, so no gate objects or QNodes
+    are created per evaluation.
+
+    Parameters
+    ----------
+    depth : int
+        The number of QAOA layers.
+
+    Q : np.ndarray
+        The Ising matrix of the problem (same convention as `QAOA_layer`).
+
+    edges : tuple, optional
+        Precomputed (rows, cols) arrays of the edges, in row-major order. By default they
+        are the nonzero off-diagonal entries of Q.
+    """
+
+    def __init__(self, depth, Q, edges=None):
+        self.Q = np.asarray(Q, dtype=float)
+        self.p = depth
+        self.n = self.Q.shape[0]
+        self.spins = spin_table(self.n)
+        self.energies = ising_energies(self.Q, self.spins)
+        if edges is None:
+            edges = np.nonzero(self.Q - np.diag(np.diag(self.Q)))
+        self.rows, self.cols = edges
+
+    def state(self, params):
+        """
+        Returns the final QAOA statevector for the given parameters.
+
+        Parameters
+        ----------
+        params : array_like
+            Gamma values followed by beta values, 2 * depth entries.
+        """
+        params = np.asarray(params, dtype=float)
+        gammas, betas = params[:self.p], params[self.p:]
+        state = np.full(2 ** self.n, 2 ** (-self.n / 2), dtype=complex)
+        for layer in range(self.p):
+            state = state * np.exp(-1j * gammas[layer] * self.energies)
+            state = apply_rx_layer(state, betas[layer], self.n)
+        return state
+
+    def probs(self, params):
+        """
+        Returns the computational basis probabilities of the final QAOA state.
+        """
+        return np.abs(self.state(params)) ** 2
+
+    def correlations(self, params):
+        """
+        Returns the (n, n) matrix of <Z_i Z_j> of the final QAOA state.
+        """
+        return zz_correlation_matrix(self.probs(params), self.spins)
+
+    def edge_expectations(self, params):
+        """
+        Returns <Z_i Z_j> for every nonzero off-diagonal entry of Q, in the same
+        row-major order as the QNode measurement list in `RL_QAOA`.
+        """
+        return self.correlations(params)[self.rows, self.cols]
+
+    def edge_jacobian(self, params, max_amplitudes=2 ** 24):
+        """
+        Computes d<Z_i Z_j>/d(params) for every edge with the adjoint method.
+
+        The final state is propagated backwards once through the circuit together with
+        a batch of co-states O_e|psi>, one per edge, so the whole Jacobian costs a single
+        reverse sweep instead of one backward pass per edge.
+
+        Parameters
+        ----------
+        params : array_like
+            Gamma values followed by beta values, 2 * depth entries.
+
+        max_amplitudes : int, default=2**24
+            Upper bound on the number of complex amplitudes held in one co-state batch.
+            Edges are processed in chunks when the batch would exceed it.
+
+        Returns
+        -------
+        np.ndarray
+            Dense (edges, 2 * depth) Jacobian; columns follow the order of `params`.
+        """
+        params = np.asarray(params, dtype=float)
+        gammas, betas = params[:self.p], params[self.p:]
+        final = self.state(params)
+        observables = self.spins[:, self.rows] * self.spins[:, self.cols]
+        chunk = max(1, max_amplitudes // 2 ** self.n)
+        jacobian = np.zeros((len(self.rows), 2 * self.p))
+
+        for start in range(0, len(self.rows), chunk):
+            phi = final
+            lam = observables[:, start:start + chunk].T * final[None, :]
+            for layer in reversed(range(self.p)):
+                grad = 2 * np.imag(lam.conj() @ apply_x_sum(phi, self.n))
+                jacobian[start:start + chunk, self.p + layer] = grad
+                phi = apply_rx_layer(phi, -betas[layer], self.n)
+                lam = apply_rx_layer(lam, -betas[layer], self.n)
+
+                grad = 2 * np.imag(lam.conj() @ (self.energies * phi))
+                jacobian[start:start + chunk, layer] = grad
+                phase = np.exp(1j * gammas[layer] * self.energies)
+                phi = phi * phase
+                lam = lam * phase[None, :]
+        return jacobian
+
+
+def combination_rank(bits):
+    """
+    Ranks bit strings of equal Hamming weight in the combinatorial number system.
+
+    A string with ones at positions c_1 < ... < c_k gets the rank sum_j C(c_j, j), which maps
+    the C(n, k) strings of weight k one-to-one onto 0 .. C(n, k) - 1.
+
+    Args:
+        bits (np.ndarray): A (m, n) array of 0/1 strings, all of the same weight.
+
+    Returns:
+        np.ndarray: The m ranks.
+    """
+    bits = np.asarray(bits, dtype=np.int64)
+    n = bits.shape[-1]
+    binomials = np.array([[math.comb(i, j) for j in range(n + 1)] for i in range(n)], dtype=np.int64)
+    ones = np.cumsum(bits, axis=-1)  # j of the one at every position
+    return np.sum(bits * binomials[np.arange(n), ones], axis=-1)
+
+
+def hamming_spin_table(n, k):
+    """
+    Builds the table of Z eigenvalues of the basis states of Hamming weight k.
+
+    Args:
+        n (int): Number of qubits.
+        k (int): Number of qubits in |1>.
+
+    Returns:
+        np.ndarray: A (C(n, k), n) array in `combination_rank` order, with the convention of
+        `spin_table` (+1 for |0>, -1 for |1>).
+    """
+    bits = np.zeros((math.comb(n, k), n), dtype=np.int8)
+    for row, ones in enumerate(itertools.combinations(range(n), k)):
+        bits[row, list(ones)] = 1
+    table = np.empty_like(bits)
+    table[combination_rank(bits)] = 1 - 2 * bits
+    return table
+
+
+def xy_mixer(spins, pairs):
+    """
+    Builds sum_(a, b) (X_a X_b + Y_a Y_b) / 2 on a Hamming-weight subspace.
+
+    Every term swaps the excitation between qubits a and b, so the subspace is preserved.
+
+    Args:
+        spins (np.ndarray): Output of `hamming_spin_table`.
+        pairs (list of tuples): Qubit pairs coupled by the mixer.
+
+    Returns:
+        scipy.sparse.csr_matrix: The (C(n, k), C(n, k)) mixer Hamiltonian.
+    """
+    bits = (1 - spins) // 2
+    rows, cols = [], []
+    for a, b in pairs:
+        movable = np.nonzero(bits[:, a] != bits[:, b])[0]
+        swapped = bits[movable].copy()
+        swapped[:, [a, b]] = swapped[:, [b, a]]
+        rows.append(combination_rank(swapped))
+        cols.append(movable)
+    rows, cols = np.concatenate(rows), np.concatenate(cols)
+    size = spins.shape[0]
+    return sparse.csr_matrix((np.ones(len(rows)), (rows, cols)), shape=(size, size))
+
+
+class SubspaceQAOA:
+    """
+    A constraint-preserving QAOA simulated on the states of Hamming weight k only.
+
+    The circuit starts from the Dicke state (the uniform superposition of the C(n, k) states
+    of weight k) and alternates the cost phases with an XY mixer, which conserves the weight.
+    Amplitudes are indexed by `combination_rank`, so n = 15, k = 5 needs 3003 amplitudes
+    instead of 32768, and a cardinality penalty (see `add_constraint`) is constant on the
+    subspace and can be left out of Q.
+
+    Parameters
+    ----------
+    depth : int
+        The number of QAOA layers.
+
+    Q : np.ndarray
+        The Ising matrix of the problem (same convention as `QAOA_layer`).
+
+    k : int
+        Hamming weight, i.e. number of qubits in |1> (x_i = 1 under `qubo_to_ising`).
+
+    mixer : str, default='ring'
+        'ring' couples the qubits (i, i + 1 mod n), 'complete' couples every pair.
+
+    edges : tuple, optional
+        Precomputed (rows, cols) arrays of the edges, in row-major order. By default they
+        are the nonzero off-diagonal entries of Q.
+    """
+
+    def __init__(self, depth, Q, k, mixer='ring', edges=None):
+        self.Q = np.asarray(Q, dtype=float)
+        self.p = depth
+        self.n = self.Q.shape[0]
+        self.k = k
+        if mixer == 'ring':
+            pairs = [(i, (i + 1) % self.n) for i in range(self.n if self.n > 2 else 1)]
+        elif mixer == 'complete':
+            pairs = list(itertools.combinations(range(self.n), 2))
+        else:
+            raise ValueError(f"Unknown mixer '{mixer}'")
+        self.spins = hamming_spin_table(self.n, k)
+        self.energies = ising_energies(self.Q, self.spins)
+        self.mixer = xy_mixer(self.spins, pairs)
+        if edges is None:
+            edges = np.nonzero(self.Q - np.diag(np.diag(self.Q)))
+        self.rows, self.cols = edges
+
+    def _mix(self, state, beta):
+        """
+        Applies exp(-i beta H_XY) to a state, or to the columns of a (dimension, m) array.
+        """
+        return expm_multiply(-1j * beta * self.mixer, state)
+
+    def state(self, params):
+        """
+        Returns the final QAOA state on the subspace for the given parameters.
+
+        Parameters
+        ----------
+        params : array_like
+            Gamma values followed by beta values, 2 * depth entries.
+        """
+        params = np.asarray(params, dtype=float)
+        gammas, betas = params[:self.p], params[self.p:]
+        state = np.full(self.spins.shape[0], self.spins.shape[0] ** -0.5, dtype=complex)
+        for layer in range(self.p):
+            state = state * np.exp(-1j * gammas[layer] * self.energies)
+            state = self._mix(state, betas[layer])
+        return state
+
+    def probs(self, params):
+        """
+        Returns the probabilities of the basis states of the subspace, in `combination_rank` order.
+        """
+        return np.abs(self.state(params)) ** 2
+
+    def correlations(self, params):
+        """
+        Returns the (n, n) matrix of <Z_i Z_j> of the final QAOA state.
+        """
+        return zz_correlation_matrix(self.probs(params), self.spins)
+
+    def edge_expectations(self, params):
+        """
+        Returns <Z_i Z_j> for every edge, in the order of `StatevectorQAOA.edge_expectations`.
+        """
+        return self.correlations(params)[self.rows, self.cols]
+
+    def edge_jacobian(self, params):
+        """
+        Computes d<Z_i Z_j>/d(params) for every edge with the adjoint method, as
+        `StatevectorQAOA.edge_jacobian` with the XY mixer as the generator of the beta layers.
+
+        Parameters
+        ----------
+        params : array_like
+            Gamma values followed by beta values, 2 * depth entries.
+
+        Returns
+        -------
+        np.ndarray
+            Dense (edges, 2 * depth) Jacobian; columns follow the order of `params`.
+        """
+        params = np.asarray(params, dtype=float)
+        gammas, betas = params[:self.p], params[self.p:]
+        phi = self.state(params)
+        observables = self.spins[:, self.rows] * self.spins[:, self.cols]
+        lam = observables * phi[:, None]  # One co-state per column
+        jacobian = np.zeros((len(self.rows), 2 * self.p))
+
+        for layer in reversed(range(self.p)):
+            jacobian[:, self.p + layer] = 2 * np.imag(lam.conj().T @ (self.mixer @ phi))
+            phi = self._mix(phi, -betas[layer])
+            lam = self._mix(lam, -betas[layer])
+
+            jacobian[:, layer] = 2 * np.imag(lam.conj().T @ (self.energies * phi))
+            phase = np.exp(1j * gammas[layer] * self.energies)
+            phi = phi * phase
+            lam = lam * phase[:, None]
+        return jacobian
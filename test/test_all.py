@@ -11,6 +11,8 @@ episode = 50
 epoch = 100
 matrix_size= 9
 hamming_weight =5
+# Directory of the persistent expectation cache (None disables it)
+cache_dir = None
 
 for matrix_idx in range(511, 520):
     test_qaa(
@@ -23,6 +25,7 @@ for matrix_idx in range(511, 520):
         hamming_weight=hamming_weight,
         model_name="RL_QAA",
         save_dir=save_dir,
+        cache_dir=cache_dir,
     )
 
     test_qaa(
@@ -35,6 +38,7 @@ for matrix_idx in range(511, 520):
         hamming_weight=hamming_weight,
         model_name="R_QAA",
         save_dir=save_dir,
+        cache_dir=cache_dir,
     )
 
     test_qaoa(
@@ -47,4 +51,5 @@ for matrix_idx in range(511, 520):
         hamming_weight=hamming_weight,
         model_name="RL_QAOA",
         save_dir=save_dir,
+        cache_dir=cache_dir,
     )
@@ -0,0 +1,28 @@
+import json
+import platform
+
+from codes.cost_model import CostModel, as_cost_model
+
+
+def test_host_model_is_calibrated_once(tmp_path):
+    model = CostModel.for_host(str(tmp_path))
+    assert model.path == str(tmp_path / f'cost_model_{platform.node()}.json')
+    model.calibrate('sum', lambda Q: Q.sum(), [4, 8], repeats=1)
+
+    reloaded = as_cost_model(model.path)
+    assert reloaded.has('sum') and reloaded.max_size('sum') == 8
+    assert reloaded.predict('sum', 6) > 0
+
+
+def test_fits_without_sizes_are_recalibrated(tmp_path):
+    path = tmp_path / 'costs.json'
+    path.write_text(json.dumps({platform.node(): {'sum': [0.0, 1.0]}}))
+    assert not CostModel(str(path)).has('sum')
+
+
+def test_model_without_path_stays_in_memory(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    model = CostModel()
+    model.calibrate('sum', lambda Q: Q.sum(), [4, 8], repeats=1)
+    assert model.has('sum') and not list(tmp_path.iterdir())
+    assert as_cost_model(None) is None and as_cost_model(model) is model
@@ -0,0 +1,173 @@
+import resource
+
+import numpy as np
+import pytest
+
+from codes.data_process import (
+    ExpectationStore, ParityUnionFind, ReducedIsing, TranspositionTable, Tree, make_check, off_diagonal_median,
+    problem_key, zero_lower_triangle,
+)
+
+
+def test_make_check_chains_sequences():
+    # Z1 = -Z2 and Z2 = Z3 give Z1 = -Z2 = -Z3
+    assert make_check([[1, -2], [2, 3]]) == [[1, -2, -3]]
+
+
+def test_make_check_bridges_groups():
+    # Z4 = -Z2 joins the groups of Z1 = -Z2 and Z3 = Z4
+    assert make_check([[1, -2], [3, 4], [4, -2]]) == [[1, -2, 3, 4]]
+
+
+def test_make_check_keeps_independent_groups():
+    assert make_check([[-5, 6], [1, 2]]) == [[-5, 6], [1, 2]]
+
+
+def test_relative_sign():
+    constraints = ParityUnionFind()
+    constraints.union(0, 1, -1)
+    constraints.union(1, 2, 1)
+    assert constraints.relative_sign(0, 2) == -1
+    assert constraints.relative_sign(2, 1) == 1
+    assert constraints.relative_sign(0, 3) is None
+
+
+def test_store_hits_do_not_hold_file_descriptors(tmp_path):
+    store = ExpectationStore(str(tmp_path))
+    keys = [problem_key(np.array([[float(i)]])) for i in range(300)]
+    for key in keys:
+        store.fetch('qaoa_p1', key, 'expectations', lambda: np.arange(3.0))
+
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (min(128, hard), hard))
+    try:
+        # The table keeps every hit alive, more of them than the descriptor limit
+        table = TranspositionTable(len(keys))
+        for key in keys:
+            table.fetch(key, 'expectations', lambda: store.fetch('qaoa_p1', key, 'expectations', None))
+    finally:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (soft, hard))
+    assert store.hits == len(keys)
+    assert all(np.array_equal(table.get(key)['expectations'], np.arange(3.0)) for key in keys)
+
+
+def test_tree_extract_keeps_selected_nodes_and_their_paths():
+    tree = Tree('root', None)
+    tree.create(1, [1.0])
+    tree.move(1)
+    tree.create(2, None)
+    tree.move(2)
+    tree.create(3, [3.0])
+    tree.reset_state()
+    tree.create(4, [4.0])
+    old = set(tree.nodes())
+    tree.move(1)
+    tree.create(5, [5.0])
+
+    extracted = Tree('root', None)
+    extracted.merge(tree.extract(lambda node: node not in old))
+    assert extracted.size == 3
+    assert extracted.root.children[1].value is None
+    assert extracted.root.children[1].children[5].value == np.float32(5.0)
+
+
+def reduce_hamiltonian(J, k, l, removed, sign):
+    """
+    The former dense reduction, kept as the reference of `ReducedIsing.eliminate`: merges
+    node k into node l, deletes it, and re-expands the result with zero rows and columns at
+    the removed original nodes.
+    """
+    J_res = np.array(J, dtype=float)
+    for i in range(J.shape[0]):
+        if i != k and i != l:
+            J_res[i, l] += sign * J_res[i, k]
+            J_res[l, i] += sign * J_res[k, i]
+    J_res[l, l] += sign * J_res[k, k]
+    J_res = zero_lower_triangle(J_res)
+    J_res = np.delete(np.delete(J_res, k, axis=0), k, axis=1)
+    R = J_res
+    for m in sorted(removed):
+        R = np.insert(np.insert(R, m, 0, axis=0), m, 0, axis=1)
+    return J_res, R
+
+
+@pytest.mark.parametrize('normalize', [False, True])
+def test_reduced_ising_matches_dense_reduction(normalize):
+    rng = np.random.default_rng(5)
+    n = 8
+    Q = np.triu(rng.normal(size=(n, n)))
+    reduced = ReducedIsing(Q, normalize=normalize)
+
+    def normalized(matrix):
+        return matrix / off_diagonal_median(matrix) if normalize else matrix
+
+    expected, nodes, removed = normalized(Q), list(range(n)), []
+    for sign in (1, -1, -1, 1, 1, -1):
+        rows, cols = np.nonzero(np.triu(expected, 1))
+        edge = rng.integers(len(rows))
+        k, l = int(rows[edge]), int(cols[edge])
+        removed.append(nodes.pop(k))
+        expected, R = reduce_hamiltonian(expected, k, l, removed, sign)
+        reduced.eliminate(k, l, sign)
+        if not normalize:
+            embedded = np.zeros((n, n))
+            embedded[np.ix_(reduced.nodes[:reduced.size], reduced.nodes[:reduced.size])] = reduced.matrix
+            assert np.allclose(embedded, R)
+        expected = normalized(expected)
+        assert np.allclose(reduced.matrix, expected)
+        assert reduced.nodes[:reduced.size].tolist() == nodes
+
+
+def test_table_evicts_least_recently_used():
+    table = TranspositionTable(2)
+    table.fetch('a', 'expectations', lambda: 1)
+    table.fetch('b', 'expectations', lambda: 2)
+    assert table.fetch('a', 'expectations', lambda: None) == 1  # a is now the most recent
+    table.fetch('c', 'expectations', lambda: 3)
+    assert list(table.entries) == ['a', 'c']
+    table.fetch('a', 'gradients', lambda: 4)  # a second field shares the entry
+    assert table.get('a') == {'expectations': 1, 'gradients': 4}
+    assert (table.hits, table.misses) == (1, 4)
+
+
+def tree_bytes(tree):
+    """
+    Recomputes the byte estimate of a tree from its nodes.
+    """
+    return sum(Tree.NODE_BYTES + (0 if node.value is None else node.value.nbytes) for node in tree.nodes())
+
+
+def test_tree_budget_evicts_oldest_subtrees_to_low_water():
+    value = np.zeros(100)
+    unit = Tree.NODE_BYTES + 400  # a node holding 100 float32 values
+    tree = Tree('root', None, max_bytes=Tree.NODE_BYTES + 3.5 * unit)
+    for path in ((1, 11), (2,), (3,)):  # one episode per path
+        tree.reset_state()
+        for key in path:
+            tree.create(key, value)
+            tree.move(key)
+
+    assert sorted(tree.root.children) == [2, 3]  # the subtree of the first episode was dropped
+    assert (tree.size, tree.evicted) == (3, 2)
+    assert tree.nbytes == tree_bytes(tree) <= tree.max_bytes * Tree.LOW_WATER
+
+
+def test_tree_merge_keeps_values_and_grafts_subtrees():
+    tree = Tree('root', None)
+    tree.create(1, [1.0])
+    tree.create(2, None)
+    other = Tree('root', None)
+    other.create(1, [-1.0])
+    other.create(2, [2.0])
+    other.create(3, [3.0])
+    other.move(3)
+    other.create(31, [31.0])
+    other.clock = 5
+
+    tree.merge(other)
+    children = tree.root.children
+    assert children[1].value == np.float32(1.0)  # values held here win
+    assert children[2].value == np.float32(2.0)  # missing values are taken over
+    assert children[3].children[31].value == np.float32(31.0)
+    assert (tree.size, tree.node_num, tree.clock) == (5, 4, 5)
+    assert tree.nbytes == tree_bytes(tree)
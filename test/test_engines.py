@@ -0,0 +1,182 @@
+import itertools
+import math
+
+import numpy as np
+import pennylane as qml
+import pytest
+import scipy.linalg
+
+from codes.analytic_qaoa import AnalyticQAOA
+from codes.exact_solver import collapse_constraints, exact_minimum
+from codes.pulse_simulator import Pulse_simulation_fixed, simulate_statevector_batch
+from codes.rl_qaoa import QAOA_layer
+from codes.statevector import (
+    StatevectorQAOA, SubspaceQAOA, combination_rank, hamming_spin_table, ising_energies, spin_table,
+    zz_correlation_matrix,
+)
+
+
+def random_ising(n, seed, density=1.0):
+    """
+    Random upper-triangular Ising matrix with local fields and (optionally sparse) couplings.
+    """
+    rng = np.random.default_rng(seed)
+    Q = np.triu(rng.normal(size=(n, n)))
+    mask = np.triu(rng.random((n, n)) < density, 1) | np.eye(n, dtype=bool)
+    return Q * mask
+
+
+def finite_differences(f, params, eps=1e-6):
+    """
+    Central differences of the vector function f, one column per parameter.
+    """
+    columns = []
+    for t in range(len(params)):
+        step = np.zeros(len(params))
+        step[t] = eps
+        columns.append((f(params + step) - f(params - step)) / (2 * eps))
+    return np.stack(columns, axis=1)
+
+
+@pytest.mark.parametrize('n, depth', [(3, 1), (4, 2)])
+def test_statevector_matches_pennylane(n, depth):
+    Q = random_ising(n, seed=n)
+    params = np.random.default_rng(0).normal(size=2 * depth)
+    layer = QAOA_layer(depth, Q)
+
+    @qml.qnode(layer.dev)
+    def circuit(param):
+        layer.qaoa_circuit(param)
+        return qml.probs(wires=range(n))
+
+    expected = zz_correlation_matrix(np.array(circuit(params)))
+    assert np.allclose(StatevectorQAOA(depth, Q).correlations(params), expected, atol=1e-9)
+
+
+@pytest.mark.parametrize('n, depth', [(4, 1), (5, 3)])
+def test_statevector_adjoint_jacobian(n, depth):
+    engine = StatevectorQAOA(depth, random_ising(n, seed=n, density=0.7))
+    params = np.random.default_rng(1).normal(size=2 * depth)
+    expected = finite_differences(engine.edge_expectations, params)
+    assert np.allclose(engine.edge_jacobian(params), expected, atol=1e-7)
+
+
+def random_qubo(n, seed):
+    """
+    Random symmetric QUBO matrix, the input of `Pulse_simulation_fixed`.
+    """
+    Q = random_ising(n, seed)
+    return Q + np.triu(Q, 1).T
+
+
+def test_split_operator_matches_pennylane_trotter():
+    simulation = Pulse_simulation_fixed(random_qubo(3, seed=0), step_time=100)
+    probs = np.abs(simulation.simulate_statevector()) ** 2
+    expected = np.array(simulation.simulate_time_evolution(), dtype=float)
+    assert np.allclose(spin_table(3).T @ probs, expected, atol=1e-9)
+
+
+def test_statevector_batch_matches_single_runs():
+    simulations = [Pulse_simulation_fixed(random_qubo(4, seed), step_time=100) for seed in range(3)]
+    states = simulate_statevector_batch(simulations)
+    for simulation, state in zip(simulations, states):
+        assert np.allclose(state, simulation.simulate_statevector(), atol=1e-12)
+
+
+def pauli_x(n, q):
+    """
+    Dense X on qubit q of n (wire 0 is the most significant bit, as in `spin_table`).
+    """
+    return np.kron(np.kron(np.eye(2 ** q), [[0, 1], [1, 0]]), np.eye(2 ** (n - q - 1)))
+
+
+@pytest.mark.parametrize('dense_qubits', [6, 0])
+def test_adaptive_matches_exact_step_propagation(dense_qubits):
+    n = 3
+    simulation = Pulse_simulation_fixed(random_qubo(n, seed=1), step_time=100)
+    tau = simulation.step_time / 1000
+    static = ising_energies(simulation.Q_ising)
+    state = np.zeros(2 ** n, dtype=complex)
+    state[0] = 1
+    for amp, detune in zip(simulation.amplitude_t, simulation.detuning_t):
+        H = np.diag(static + spin_table(n) @ detune / 2) + sum(amp[q] / 2 * pauli_x(n, q) for q in range(n))
+        state = scipy.linalg.expm(-1j * tau * H) @ state
+
+    assert np.allclose(simulation.simulate_adaptive(tol=0, dense_qubits=dense_qubits), state, atol=1e-9)
+    steps = simulation.num_steps_used
+    coarse = simulation.simulate_adaptive(tol=0.1, dense_qubits=dense_qubits)
+    assert simulation.num_steps_used < steps
+    assert abs(np.vdot(coarse, state)) ** 2 > 0.99
+
+
+@pytest.mark.parametrize('block_bits', [16, 3, 0])
+def test_exact_minimum_matches_brute_force(block_bits):
+    n = 7
+    Q = random_ising(n, seed=2)
+    same_list, diff_list = [(0, 3), (3, 5)], [(1, 6)]
+    for constraints in (([], []), (same_list, diff_list)):
+        spins = spin_table(n)
+        feasible = np.ones(len(spins), dtype=bool)
+        for i, j in constraints[0]:
+            feasible &= spins[:, i] == spins[:, j]
+        for i, j in constraints[1]:
+            feasible &= spins[:, i] != spins[:, j]
+        energies = ising_energies(Q)[feasible]
+
+        reps, signs = collapse_constraints(*constraints, n)
+        state, value = exact_minimum(Q, reps, signs, block_bits=block_bits)
+        assert np.isclose(value, energies.min())
+        assert np.isclose(ising_energies(Q, state[None, :])[0], value)
+        assert any(np.array_equal(state, row) for row in spins[feasible])
+
+
+@pytest.mark.parametrize('n, density', [(2, 1.0), (5, 1.0), (7, 0.5)])
+def test_analytic_matches_statevector(n, density):
+    Q = random_ising(n, seed=n, density=density)
+    params = np.random.default_rng(3).normal(size=2)
+    analytic = AnalyticQAOA(1, Q)
+    statevector = StatevectorQAOA(1, Q, (analytic.rows, analytic.cols))
+    assert np.allclose(analytic.correlations(params), statevector.correlations(params), atol=1e-12)
+    assert np.allclose(analytic.edge_jacobian(params), statevector.edge_jacobian(params), atol=1e-12)
+
+
+def test_analytic_requires_depth_one():
+    with pytest.raises(ValueError):
+        AnalyticQAOA(2, random_ising(3, seed=0))
+
+
+def test_combination_rank_is_a_bijection():
+    bits = (1 - hamming_spin_table(7, 3)) // 2
+    assert np.array_equal(combination_rank(bits), np.arange(math.comb(7, 3)))
+    assert np.all(bits.sum(axis=1) == 3)
+
+
+def pauli_y(n, q):
+    """
+    Dense Y on qubit q of n.
+    """
+    return np.kron(np.kron(np.eye(2 ** q), [[0, -1j], [1j, 0]]), np.eye(2 ** (n - q - 1)))
+
+
+@pytest.mark.parametrize('n, k, mixer, depth', [(4, 2, 'ring', 1), (5, 2, 'complete', 2), (6, 3, 'ring', 2)])
+def test_subspace_matches_dense_xy_evolution(n, k, mixer, depth):
+    Q = random_ising(n, seed=n)
+    params = np.random.default_rng(4).normal(size=2 * depth)
+    if mixer == 'ring':
+        pairs = [(i, (i + 1) % n) for i in range(n)]
+    else:
+        pairs = list(itertools.combinations(range(n), 2))
+    H = sum((pauli_x(n, a) @ pauli_x(n, b) + pauli_y(n, a) @ pauli_y(n, b)) / 2 for a, b in pairs)
+
+    spins = spin_table(n)
+    feasible = np.sum(spins == -1, axis=1) == k
+    state = feasible / np.sqrt(feasible.sum()) + 0j
+    for layer in range(depth):
+        state = state * np.exp(-1j * params[layer] * ising_energies(Q, spins))
+        state = scipy.linalg.expm(-1j * params[depth + layer] * H) @ state
+    assert np.allclose(state[~feasible], 0, atol=1e-12)
+
+    engine = SubspaceQAOA(depth, Q, k, mixer)
+    expected = zz_correlation_matrix(np.abs(state) ** 2, spins)
+    assert np.allclose(engine.correlations(params), expected, atol=1e-10)
+    assert np.allclose(engine.edge_jacobian(params), finite_differences(engine.edge_expectations, params), atol=1e-6)
@@ -27,7 +27,7 @@ def QpasqalOptimized(matrix, number):
 
 
 
-def test_qaa(num_episode , num_epoch ,beta , lr ,matrix_idx ,model_name ,matrix_size,hamming_weight ,save_dir):
+def test_qaa(num_episode , num_epoch ,beta , lr ,matrix_idx ,model_name ,matrix_size,hamming_weight ,save_dir, cache_dir=None):
     depth = 1
     size =matrix_size
     seed = 50
@@ -53,6 +53,7 @@ def test_qaa(num_episode , num_epoch ,beta , lr ,matrix_idx ,model_name ,matrix_
     n,
     np.array([[beta] * int((n**2)) for i in range(n - n_c)]),
     learning_rate_init=lr,
+    store=cache_dir,
     )
     final_config = rl_qaa.rqaoa_execute()
     rl_qaa.n_c = n_c
@@ -29,7 +29,7 @@ def QpasqalOptimized(matrix, number):
 
 
 
-def test_qaoa(num_episode, num_epoch, beta, matrix_idx,lr,matrix_size, hamming_weight, model_name,save_dir):
+def test_qaoa(num_episode, num_epoch, beta, matrix_idx,lr,matrix_size, hamming_weight, model_name,save_dir, cache_dir=None):
     depth = 1
     size = matrix_size
     seed = 50
@@ -60,6 +60,7 @@ def test_qaoa(num_episode, num_epoch, beta, matrix_idx,lr,matrix_size, hamming_w
         b_vector=b_vector,
         QAOA_depth=1,
         learning_rate_init= lr,
+        store=cache_dir,
     )
 
     final_config = rl_qaoa.rqaoa_execute()
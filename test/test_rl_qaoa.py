@@ -0,0 +1,112 @@
+import numpy as np
+import pytest
+
+from codes.data_process import ParityUnionFind, ReducedIsing
+from codes.rl_qaoa import RL_QAA, EpisodeAccumulator, RL_QAOA
+
+
+def random_ising(n, seed):
+    """
+    Random upper-triangular Ising matrix.
+    """
+    return np.triu(np.random.default_rng(seed).normal(size=(n, n)))
+
+
+def make_qaoa(n, n_c, **kwargs):
+    return RL_QAOA(
+        random_ising(n, seed=n), n_c, np.array([0.1, 0.2] * (n - n_c)), np.full((n - n_c, n * n), 2.0), 1,
+        learning_rate_init=[0.1, 0.1], ising=True, backend='numpy', **kwargs,
+    )
+
+
+def make_qaa(n, n_c, **kwargs):
+    Q = random_ising(n, seed=n)
+    return RL_QAA(Q + np.triu(Q, 1).T, n_c, np.full((n - n_c, n * n), 2.0), learning_rate_init=0.5, backend='numpy', **kwargs)
+
+
+def list_baseline(values, QAOA_diffs, beta_diffs):
+    """
+    The former list-based mean-baseline update of an epoch.
+    """
+    batch_mean = np.array(values) - np.mean(values)
+    QAOA = [-centred * diff for centred, diff in zip(batch_mean, QAOA_diffs)]
+    beta = [-centred * diff for centred, diff in zip(batch_mean, beta_diffs)]
+    return np.mean(QAOA, axis=0), np.mean(beta, axis=0), np.mean(values)
+
+
+def test_accumulator_matches_list_baseline_with_large_offset():
+    rng = np.random.default_rng(0)
+    K = 64
+    # Multiples of 2**-10, so the rewards, their sum and their mean are exact and so is the reference
+    values = 1e9 + np.round(rng.normal(size=K) * 1024) / 1024
+    QAOA_diffs = rng.normal(size=(K, 4))
+    beta_diffs = rng.normal(size=(K, 3, 10))
+    QAOA, beta, mean = list_baseline(values, QAOA_diffs, beta_diffs)
+
+    single = EpisodeAccumulator()
+    for e in range(K):
+        single.add(e, (QAOA_diffs[e], beta_diffs[e], values[e], np.ones(3), [], []))
+    # Partial accumulators, with different shifts, merged in episode order
+    merged = EpisodeAccumulator()
+    for chunk in np.array_split(np.arange(K), 3):
+        partial = EpisodeAccumulator()
+        partial.add_batch(chunk, QAOA_diffs[chunk], beta_diffs[chunk], values[chunk], np.ones((len(chunk), 3)),
+                          [[]] * len(chunk), [[]] * len(chunk))
+        merged.merge(partial)
+
+    for accumulator in (single, merged):
+        epoch = accumulator.epoch()
+        assert np.allclose(epoch['QAOA_diff'], QAOA, rtol=0, atol=1e-9)
+        assert np.allclose(epoch['beta_diff'], beta, rtol=0, atol=1e-9)
+        assert np.isclose(epoch['value'], mean, rtol=1e-15)
+
+
+@pytest.mark.parametrize('make_model', [make_qaoa, make_qaa])
+def test_batched_misses_match_sequential_episodes(make_model):
+    results = []
+    for batch_misses in (False, True):
+        model = make_model(6, 2)
+        model.RL_QAOA(episodes=6, epochs=2, log_interval=100, seed=3, batch_misses=batch_misses)
+        results.append((np.array(model.b, dtype=float), np.array(model.param, dtype=float), model.avg_values))
+    (b, param, values), (batched_b, batched_param, batched_values) = results
+    assert np.allclose(b, batched_b, rtol=0, atol=1e-10)
+    assert np.allclose(param, batched_param, rtol=0, atol=1e-10)
+    assert np.allclose(values, batched_values, rtol=0, atol=1e-10)
+
+
+def test_multi_edge_selection_cuts_a_forest_with_its_score():
+    n, count = 6, 3
+    model = make_qaoa(n, 2, edges_per_step=count)
+    rng = np.random.default_rng(7)
+    model.beta = rng.uniform(0.5, 2.0, size=n * n)
+    model.rng = np.random.default_rng(8)
+    edges = ReducedIsing(random_ising(n, seed=1)).edges
+    correlations = rng.uniform(-1, 1, size=(n, n))
+    selected, policy_sum, expectations = model._select_edges_to_cut(edges, correlations, count)
+
+    assert len(selected) == count
+    forest = ParityUnionFind()
+    for idx in selected:
+        i, j = int(edges.rows[idx]), int(edges.cols[idx])
+        assert forest.find(i)[0] != forest.find(j)[0]
+        forest.union(i, j, 1)
+
+    def log_probability(beta):
+        # Sequential draws without replacement among the edges joining two components
+        logits = np.abs(expectations) * beta[edges.flat]
+        components, total = ParityUnionFind(), 0.0
+        for idx in selected:
+            eligible = np.array([components.find(int(i))[0] != components.find(int(j))[0]
+                                 for i, j in zip(edges.rows, edges.cols)])
+            total += logits[idx] - np.log(np.sum(np.exp(logits[eligible])))
+            components.union(int(edges.rows[idx]), int(edges.cols[idx]), 1)
+        return total
+
+    eps = 1e-6
+    expected = np.zeros(n * n)
+    for e in edges.flat:
+        step = np.zeros(n * n)
+        step[e] = eps
+        expected[e] = (log_probability(model.beta + step) - log_probability(model.beta - step)) / (2 * eps)
+    score = model._compute_grad_beta(selected, edges, policy_sum, expectations)
+    assert np.allclose(score, expected, atol=1e-7)
@@ -0,0 +1,38 @@
+import numpy as np
+import pytest
+
+from codes.rl_qaoa import RL_QAOA
+
+
+def make_model(n, n_c, seed, density=1.0):
+    """
+    Depth-1 statevector model of a random Ising problem with frozen QAOA parameters.
+    """
+    rng = np.random.default_rng(seed)
+    Q = np.triu(rng.normal(size=(n, n)))
+    Q *= np.triu(rng.random((n, n)) < density, 1) | np.eye(n, dtype=bool)
+    return RL_QAOA(
+        Q, n_c, np.array([0.1, 0.2] * (n - n_c)), np.ones((n - n_c, n * n)), 1,
+        learning_rate_init=[0.0, 0.1], ising=True, backend='numpy',
+    )
+
+
+@pytest.mark.parametrize('density', [1.0, 0.8])
+def test_count_matches_expanded_tree(density):
+    model = make_model(6, 3, seed=1, density=density)
+    rollout = model._cached_rollout()
+    nodes = rollout.count(10 ** 6)
+    assert rollout.exact(10 ** 6) is not None
+    assert model.tree.size == nodes
+    assert rollout.count(nodes - 1) == nodes
+
+
+def test_exact_falls_back_before_simulating():
+    model = make_model(9, 2, seed=2)
+
+    def simulate(*args):
+        raise AssertionError('no expectation may be evaluated')
+
+    model._qaoa_edge_expectations = simulate
+    assert model._cached_rollout().exact(10 ** 6) is None
+    assert model.tree.size == 1 and model.tree.root.value is None